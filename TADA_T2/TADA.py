@@ -1,13 +1,48 @@
 """Provide the primary functions."""
 
-import protfasta
 import os
 
+import numpy as np
+
 from TADA_T2.backend.predictor import predict_tada as _predict_tada
-from TADA_T2.backend.utils import make_sequences_constant_length, map_sequences_to_prediction, verbose_warning_message
+from TADA_T2.backend.utils import (make_sequences_constant_length, map_sequences_to_prediction,
+                                   verbose_warning_message, filter_window_scores)
+from TADA_T2.backend.profile import window_offsets, residue_profile, call_regions
+from TADA_T2.backend.instrumentation import instrument, stage as _stage
+from TADA_T2.backend.ensemble import predict_ensemble as _predict_ensemble, register_weights
+from TADA_T2.backend.results_db import ResultsDatabase
+from TADA_T2.backend.fasta import read_fasta
+from TADA_T2.backend.client import predict_remote, predict_from_fasta_remote
+from TADA_T2.backend.runtime import configure_runtime
+from TADA_T2.backend.workers import WorkerPool
+
+# the public functions, including the backend ones re-exported from here by TADA_T2/__init__.py.
+__all__ = ['predict', 'predict_from_fasta', 'predict_profile', 'predict_ensemble',
+           'register_weights', 'instrument', 'predict_remote', 'predict_from_fasta_remote',
+           'configure_runtime', 'WorkerPool']
+
+
+def _check_sequence_lengths(sequences, safe_mode=True, verbose=True, overlap_length=39, pad='GS', approach='even'):
+    """
+    Raises an error in safe mode if any sequence is under 40 amino acids, and
+    if verbose prints how sequences that are not 40 amino acids will be handled.
+    """
+    seq_lengths=[len(seq) for seq in sequences]
+    if safe_mode:
+        # check if all sequences are over 40 amino acids long
+        if not all([length>=40 for length in seq_lengths]):
+            raise ValueError('Not all sequences are 40 amino acids long. TADA was not made for sequences under '
+                             '40 amino acids. You can still make these predictions by setting safe_mode=False, '
+                             'but use this feature with extreme caution!.')
+    if any([length!=40 for length in seq_lengths]):
+        if verbose:
+            message = verbose_warning_message(overlap_length=overlap_length, pad=pad, approach=approach)
+            print(str(message))
 
 
-def predict(sequences, overlap_length=39, pad='GS', approach='even', verbose=True, safe_mode=True):
+def predict(sequences, overlap_length=39, pad='GS', approach='even', verbose=True, safe_mode=True,
+            threshold=None, top_k=None, feature_store=None, results_db=None, feature_backend=None,
+            batch_size=None, threads=None, workers=None):
     """
     Predicts TAD scores for a sequence or a list sequences.
 
@@ -42,6 +77,49 @@ def predict(sequences, overlap_length=39, pad='GS', approach='even', verbose=Tru
         whether to run the function in safe mode. Safe mode will raise an exception
         if any sequences are under 40 amino acids. Default is True.
 
+    threshold : float or None
+        If set, only windows with a score at or above this value are returned.
+        Default is None (return every window).
+
+    top_k : int or None
+        If set, only the top_k highest scoring windows of each sequence are returned
+        (in their original order). Can be combined with threshold. Default is None.
+
+    feature_store : str or None
+        Directory to keep the scaled features in. Later calls with the same
+        sequences read the features from there instead of recomputing them.
+        Default is None.
+
+    results_db : str or None
+        Path to a results database. Sequences already scored with the same
+        parameters are read from it and only the rest are predicted (and added).
+        Default is None.
+
+    feature_backend : str or None
+        How to calculate the features. None uses localCIDER for every feature.
+        'numba', 'numpy' or 'auto' use the fused kernels, which give the same
+        features in float32 ('auto' uses Numba if it is installed). Kappa, omega
+        and helicity are still calculated with localCIDER and alphaPredict, so
+        the gain is modest: mostly from reusing helicity for 5 residue windows
+        shared between overlapping windows. Default is None.
+
+    batch_size : int, str or None
+        Number of windows per model call, or 'auto' to pick one with a quick
+        calibration run the first time it is needed. Default is None, which
+        uses the TADA_T2_BATCH_SIZE environment variable or 'auto'.
+
+    threads : int or None
+        Number of Tensorflow threads for this process. Only takes effect before
+        the model is first loaded. Default is None, which uses
+        TADA_T2_INTRA_OP_THREADS or the cores available to this process
+        (split between TADA_T2_PROCESSES processes).
+
+    workers : int, WorkerPool or None
+        If set, windows are scored on a pool of pre-forked worker processes
+        that share one loaded copy of the model. An int starts a pool with
+        that many workers the first time and reuses it afterwards.
+        Cannot be combined with feature_store. Default is None.
+
     Returns
     -------
     dict
@@ -50,38 +128,123 @@ def predict(sequences, overlap_length=39, pad='GS', approach='even', verbose=Tru
     if isinstance(sequences, str):
         sequences=[sequences]
 
-    # get sequence lengths
-    seq_lengths=[len(seq) for seq in sequences]
-    if safe_mode:
-        # check if all sequences are over 40 amino acids long   
-        if not all([length>=40 for length in seq_lengths]):
-            raise ValueError('Not all sequences are 40 amino acids long. TADA was not made for sequences under 40 amino acids. You can still make these predictions by setting safe_mode=False, but use this feature with extreme caution!.')        
-    if any([length!=40 for length in seq_lengths]):
-        if verbose:
-            message = verbose_warning_message(overlap_length=overlap_length, pad=pad, approach=approach)
-            print(str(message))
-    seq_dict=make_sequences_constant_length(sequences, 
-                                            overlap_length=overlap_length, 
-                                            pad=pad, approach=approach)
-    padded_or_trimmed_seqs, map_to_predictions=map_sequences_to_prediction(seq_dict)
-    predictions=_predict_tada(padded_or_trimmed_seqs)
+    _check_sequence_lengths(sequences, safe_mode=safe_mode, verbose=verbose,
+                            overlap_length=overlap_length, pad=pad, approach=approach)
+    if results_db is not None:
+        return _predict_incremental(sequences, results_db, overlap_length=overlap_length, pad=pad,
+                                    approach=approach, threshold=threshold, top_k=top_k,
+                                    feature_store=feature_store, feature_backend=feature_backend,
+                                    batch_size=batch_size, threads=threads, workers=workers)
+    if threshold is not None or top_k is not None:
+        return _predict_filtered(sequences, overlap_length=overlap_length, pad=pad,
+                                 approach=approach, threshold=threshold, top_k=top_k,
+                                 feature_store=feature_store, feature_backend=feature_backend,
+                                 batch_size=batch_size, threads=threads, workers=workers)
+    with _stage('make_sequences_constant_length'):
+        seq_dict=make_sequences_constant_length(sequences, 
+                                                overlap_length=overlap_length, 
+                                                pad=pad, approach=approach)
+        padded_or_trimmed_seqs, map_to_predictions=map_sequences_to_prediction(seq_dict)
+    predictions=_predict_tada(padded_or_trimmed_seqs, feature_store=feature_store,
+                              feature_backend=feature_backend, batch_size=batch_size, threads=threads,
+                              workers=workers)
     # holds final sequences
     final_dict={}
     # map the indices in the predictions to the original sequences
-    for seq, indices in map_to_predictions.items():
-        final_dict[seq]=[[padded_or_trimmed_seqs[index],predictions[index]] for index in indices]
+    with _stage('map_predictions'):
+        for seq, indices in map_to_predictions.items():
+            final_dict[seq]=[[padded_or_trimmed_seqs[index],predictions[index]] for index in indices]
+    return final_dict
+
+
+def _predict_incremental(sequences, results_db, overlap_length=39, pad='GS', approach='even',
+                         threshold=None, top_k=None, feature_store=None, feature_backend=None,
+                         batch_size=None, threads=None, workers=None):
+    '''
+    Reads sequences that were already scored with the same parameters from
+    the results database, predicts only the others and stores them.
+    '''
+    database=results_db if isinstance(results_db, ResultsDatabase) else ResultsDatabase(results_db)
+    try:
+        params=database.params_key(overlap_length=overlap_length, pad=pad, approach=approach,
+                                   threshold=threshold, top_k=top_k, feature_backend=feature_backend)
+        unique_seqs=list(dict.fromkeys(sequences))
+        # stored scores come back as floats, use the float32 the model returns.
+        final_dict={seq: [[window, np.float32(score)] for window, score in result]
+                    for seq, result in database.get_many(unique_seqs, params).items()}
+        missing=[seq for seq in unique_seqs if seq not in final_dict]
+        if missing:
+            # checks and warnings were already done by the caller.
+            new_predictions=predict(missing, overlap_length=overlap_length, pad=pad, approach=approach,
+                                    verbose=False, safe_mode=False, threshold=threshold, top_k=top_k,
+                                    feature_store=feature_store, feature_backend=feature_backend,
+                                    batch_size=batch_size, threads=threads, workers=workers)
+            database.put_many(new_predictions, params)
+            final_dict.update(new_predictions)
+    finally:
+        if database is not results_db:
+            database.close()
+    return {seq: final_dict[seq] for seq in unique_seqs}
+
+
+# max number of windows scored at once when filtering predictions.
+_FILTER_BATCH_WINDOWS=20000
+
+
+def _predict_filtered(sequences, overlap_length=39, pad='GS', approach='even',
+                      threshold=None, top_k=None, feature_store=None, feature_backend=None,
+                      batch_size=None, threads=None, workers=None):
+    '''
+    Runs predictions over batches of sequences and keeps only the windows that pass
+    the threshold / top_k filters. Each batch is windowed, scored and filtered before
+    the next one starts so windows that are filtered out never accumulate.
+    '''
+    # checked before anything is scored, the window count below divides by the step.
+    if overlap_length < 0 or overlap_length >= 40:
+        raise ValueError('Overlap must be a non-negative integer less than the window length.')
+    if top_k is not None and (int(top_k) != top_k or top_k < 1):
+        raise ValueError('top_k must be a positive integer.')
+    step=40-overlap_length
+    final_dict={}
+    batch=[]
+    batch_windows=0
+    # dict.fromkeys drops duplicate sequences while keeping input order.
+    unique_seqs=list(dict.fromkeys(sequences))
+    for i, seq in enumerate(unique_seqs):
+        batch.append(seq)
+        batch_windows+=max(1, (len(seq)-40)//step+1)
+        if batch_windows < _FILTER_BATCH_WINDOWS and i < len(unique_seqs)-1:
+            continue
+        with _stage('make_sequences_constant_length'):
+            seq_dict=make_sequences_constant_length(batch, 
+                                                    overlap_length=overlap_length, 
+                                                    pad=pad, approach=approach)
+            windows, map_to_predictions=map_sequences_to_prediction(seq_dict)
+        # float32 like the scores predict() returns without filters.
+        scores=np.asarray(_predict_tada(windows, feature_store=feature_store, feature_backend=feature_backend,
+                                        batch_size=batch_size, threads=threads, workers=workers),
+                          dtype=np.float32)
+        boundaries=[indices[0] for indices in map_to_predictions.values()]+[len(windows)]
+        with _stage('filter_window_scores'):
+            kept=filter_window_scores(scores, boundaries, threshold=threshold, top_k=top_k)
+        for (seq_key, indices), keep in zip(map_to_predictions.items(), kept):
+            final_dict[seq_key]=[[windows[indices[j]], scores[indices[j]]] for j in keep]
+        batch=[]
+        batch_windows=0
     return final_dict
 
 
 def predict_from_fasta(path_to_fasta, overlap_length=39, pad='GS', 
-                        approach='even', verbose=True, safe_mode=True):
+                        approach='even', verbose=True, safe_mode=True,
+                        threshold=None, top_k=None, feature_store=None, results_db=None,
+                        feature_backend=None, batch_size=None, threads=None, workers=None):
     """
     Predicts TAD scores for sequences in a .fasta file
 
     Parameters
     ----------
     path_to_fasta : str
-        path to a .fasta file as a string
+        path to a .fasta file as a string. The file can be gzip or bgzip compressed.
 
     overlap_length : int
         The length of the overlap between sequences.
@@ -109,6 +272,36 @@ def predict_from_fasta(path_to_fasta, overlap_length=39, pad='GS',
     verbose : bool
         whether to warn user when sequence lengths are not 40 amino acids.
 
+    threshold : float or None
+        If set, only windows with a score at or above this value are returned.
+        Default is None (return every window).
+
+    top_k : int or None
+        If set, only the top_k highest scoring windows of each sequence are returned.
+        Default is None.
+
+    feature_store : str or None
+        Directory to keep the scaled features in. Rerunning on the same .fasta
+        file reads the features from there instead of recomputing them.
+        Default is None.
+
+    results_db : str or None
+        Path to a results database. Only sequences that are new or changed since
+        an earlier run with the same parameters are scored; everything else is
+        read from the database. Default is None.
+
+    feature_backend : str or None
+        How to calculate the features, see predict(). Default is None.
+
+    batch_size : int, str or None
+        Number of windows per model call or 'auto', see predict(). Default is None.
+
+    threads : int or None
+        Number of Tensorflow threads for this process, see predict(). Default is None.
+
+    workers : int, WorkerPool or None
+        Score on a pool of pre-forked worker processes, see predict(). Default is None.
+
     Returns
     -------
     dict
@@ -121,23 +314,185 @@ def predict_from_fasta(path_to_fasta, overlap_length=39, pad='GS',
         raise ValueError('Path does not exist.')        
 
     # read in sequences
-    sequences=protfasta.read_fasta(path_to_fasta, invalid_sequence_action='convert')
+    sequences=read_fasta(path_to_fasta)
     seq_names=list(sequences.keys())
     sequences=list(sequences.values())
 
-    if safe_mode:
-        # check if all sequences are over 40 amino acids long
-        seq_lengths=[len(seq) for seq in sequences]
-        if not all([length>=40 for length in seq_lengths]):
-            raise ValueError('Not all sequences are 40 amino acids long. TADA was not made for sequences under 40 amino acids. You can still make these predictions by setting safe_mode=False, but use this feature with extreme caution!.')
-    
+    # the length warning is printed by predict().
+    _check_sequence_lengths(sequences, safe_mode=safe_mode, verbose=False)
+
     # run predictions
     predictions=predict(sequences, overlap_length=overlap_length, 
                         pad=pad, approach=approach, verbose=verbose,
-                        safe_mode=safe_mode)
+                        safe_mode=safe_mode, threshold=threshold, top_k=top_k,
+                        feature_store=feature_store, results_db=results_db,
+                        feature_backend=feature_backend, batch_size=batch_size, threads=threads,
+                        workers=workers)
 
     # map sequence names to predictions
     final_dict={}
     for i, s in enumerate(seq_names):
         final_dict[s]=[sequences[i], predictions[sequences[i]]]
     return final_dict
+
+
+def predict_profile(sequences, overlap_length=39, pad='GS', approach='even',
+                    threshold=None, track='mean', min_length=1, verbose=True, safe_mode=True):
+    """
+    Predicts per-residue TAD score profiles for a sequence or a list of sequences.
+    Every residue gets the mean and the max score over the windows that cover it.
+    Optionally calls TAD regions as contiguous stretches above a threshold.
+
+    Parameters
+    ----------
+    sequences : str or list
+        string of single sequence or list of sequences to predict TADA profiles for.
+
+    overlap_length : int
+        The length of the overlap between sequences.
+        Default is 39
+
+    pad : str
+        The approach to pad your sequence.
+        Options are 'random' or 'GS'.
+        Default is 'GS'.
+
+    approach : str
+        The approach to pad your sequence.
+        Options are 'even' or 'N' or 'C'.
+        Default is 'even'.
+
+    threshold : float or None
+        If set, regions where the profile is at or above this value are returned.
+        Default is None (no region calling).
+
+    track : str
+        Which profile to call regions from. Options are 'mean' or 'max'.
+        Default is 'mean'.
+
+    min_length : int
+        Minimum length of a called region. Default is 1.
+
+    verbose : bool
+        whether to warn user when sequence lengths are not 40 amino acids.
+
+    safe_mode : bool
+        whether to run the function in safe mode. Safe mode will raise an exception
+        if any sequences are under 40 amino acids. Default is True.
+
+    Returns
+    -------
+    dict
+        A dict with the sequence as the key and a dict as the value holding
+        the 'mean' and 'max' per-residue arrays and, if threshold was set,
+        the 'regions' as a list of [start, end] pairs (end exclusive).
+    """
+    if track not in ['mean', 'max']:
+        raise ValueError('track must be either mean or max.')
+    if isinstance(sequences, str):
+        sequences=[sequences]
+
+    _check_sequence_lengths(sequences, safe_mode=safe_mode, verbose=verbose,
+                            overlap_length=overlap_length, pad=pad, approach=approach)
+    seq_dict=make_sequences_constant_length(sequences,
+                                            overlap_length=overlap_length,
+                                            pad=pad, approach=approach)
+    padded_or_trimmed_seqs, map_to_predictions=map_sequences_to_prediction(seq_dict)
+    predictions=np.asarray(_predict_tada(padded_or_trimmed_seqs))
+
+    final_dict={}
+    with _stage('residue_profile'):
+        for seq, indices in map_to_predictions.items():
+            # windows for a sequence are contiguous in the prediction array.
+            scores=predictions[indices[0]:indices[-1]+1]
+            offsets=window_offsets(len(seq), overlap=overlap_length)
+            profile=residue_profile(scores, offsets, len(seq))
+            if threshold is not None:
+                profile['regions']=call_regions(profile[track], threshold=threshold, min_length=min_length)
+            final_dict[seq]=profile
+    return final_dict
+
+
+def predict_ensemble(sequences, weights=None, model_threads=1, overlap_length=39, pad='GS',
+                     approach='even', verbose=True, safe_mode=True, feature_store=None,
+                     feature_backend=None, batch_size=None, threads=None):
+    """
+    Predicts TAD scores for a sequence or a list of sequences with several model
+    weight files. Features are calculated once and shared by all of the models.
+
+    Parameters
+    ----------
+    sequences : str or list
+        string of single sequence or list of sequences to predict TADA scores for.
+
+    weights : dict, list or None
+        Either a dict of name -> weight file or a list of weight files.
+        Default is None, which uses every weight file added with register_weights()
+        along with the bundled tada.14-0.02.hdf5 weights.
+
+    model_threads : int
+        Number of models to run at the same time. Default is 1.
+
+    overlap_length : int
+        The length of the overlap between sequences.
+        Default is 39
+
+    pad : str
+        The approach to pad your sequence.
+        Options are 'random' or 'GS'.
+        Default is 'GS'.
+
+    approach : str
+        The approach to pad your sequence.
+        Options are 'even' or 'N' or 'C'.
+        Default is 'even'.
+
+    verbose : bool
+        whether to warn user when sequence lengths are not 40 amino acids.
+
+    safe_mode : bool
+        whether to run the function in safe mode. Safe mode will raise an exception
+        if any sequences are under 40 amino acids. Default is True.
+
+    feature_store : str or None
+        Directory to keep the scaled features in. Default is None.
+
+    feature_backend : str or None
+        How to calculate the features, see predict(). Default is None.
+
+    batch_size : int, str or None
+        Number of windows per model call or 'auto', see predict(). Default is None.
+
+    threads : int or None
+        Number of Tensorflow threads for this process, see predict(). Default is None.
+
+    Returns
+    -------
+    dict
+        A dict with the sequence as the key and a dict as the value holding
+        'windows' (the 40 amino acid sequences scored), 'scores' (a dict of
+        model name -> array of scores), 'mean' and 'std' (arrays over models).
+    """
+    if isinstance(sequences, str):
+        sequences=[sequences]
+
+    _check_sequence_lengths(sequences, safe_mode=safe_mode, verbose=verbose,
+                            overlap_length=overlap_length, pad=pad, approach=approach)
+    with _stage('make_sequences_constant_length'):
+        seq_dict=make_sequences_constant_length(sequences,
+                                                overlap_length=overlap_length,
+                                                pad=pad, approach=approach)
+        padded_or_trimmed_seqs, map_to_predictions=map_sequences_to_prediction(seq_dict)
+    results=_predict_ensemble(padded_or_trimmed_seqs, weights=weights, model_threads=model_threads,
+                              feature_store=feature_store, feature_backend=feature_backend,
+                              batch_size=batch_size, threads=threads)
+
+    final_dict={}
+    for seq, indices in map_to_predictions.items():
+        # windows for a sequence are contiguous in the prediction arrays.
+        start, stop=indices[0], indices[-1]+1
+        final_dict[seq]={'windows': padded_or_trimmed_seqs[start:stop],
+                         'scores': {name: scores[start:stop] for name, scores in results['scores'].items()},
+                         'mean': results['mean'][start:stop],
+                         'std': results['std'][start:stop]}
+    return final_dict
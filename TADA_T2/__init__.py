@@ -1,6 +1,19 @@
 """A Tensorflow2 compatible version of the TADA transcriptional activation domain predictor."""
+import importlib
+
+# TADA (and with it Tensorflow) is only imported when one of its functions is
+# first used, so that TADA_T2.backend.client can be used without loading it.
+__all__ = ['predict', 'predict_from_fasta', 'predict_profile', 'predict_ensemble',
+           'register_weights', 'instrument', 'predict_remote', 'predict_from_fasta_remote',
+           'configure_runtime', 'WorkerPool']
+
+
+def __getattr__(name):
+    if name == 'TADA':
+        return importlib.import_module('TADA_T2.TADA')
+    if name in __all__:
+        return getattr(importlib.import_module('TADA_T2.TADA'), name)
+    raise AttributeError(f"module 'TADA_T2' has no attribute {name!r}")
 
-# Add imports here
-from TADA_T2.TADA import *
 
 from TADA_T2._version import __version__
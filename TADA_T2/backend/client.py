@@ -0,0 +1,101 @@
+'''
+Client for the local prediction server. Does not import Tensorflow
+or load the model, so short jobs start quickly.
+'''
+import http.client
+import json
+import socket
+
+from TADA_T2.backend.fasta import open_fasta
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    '''
+    HTTPConnection that connects to a Unix socket.
+    '''
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _post(payload, host='127.0.0.1', port=8765, socket_path=None, timeout=None):
+    '''
+    Sends a /predict request and returns the predictions.
+    '''
+    if socket_path is not None:
+        if not hasattr(socket, 'AF_UNIX'):
+            raise ValueError('Unix sockets are not available on this platform. Use host and port instead.')
+        connection = UnixHTTPConnection(socket_path, timeout=timeout)
+    else:
+        connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request('POST', '/predict', body=json.dumps(payload),
+                           headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        result = json.loads(response.read())
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise ValueError(f'Prediction server returned {response.status}: {result.get("error")}')
+    return result['predictions']
+
+
+def predict_remote(sequences, overlap_length=39, pad='GS', approach='even', safe_mode=True,
+                   threshold=None, top_k=None, host='127.0.0.1', port=8765, socket_path=None, timeout=None):
+    '''
+    Predicts TAD scores for a sequence or a list of sequences using a running
+    prediction server (see tada-t2 serve). Mirrors TADA.predict().
+
+    Parameters
+    ----------
+    sequences : str or list
+        string of single sequence or list of sequences to predict TADA scores for.
+    overlap_length, pad, approach, safe_mode, threshold, top_k
+        Same as for TADA.predict().
+    host : str
+        Address of the server. Default is '127.0.0.1'.
+    port : int
+        Port of the server. Default is 8765.
+    socket_path : str or None
+        Unix socket of the server. If set, host and port are ignored.
+    timeout : float or None
+        Seconds to wait for the server. Default is None (wait forever).
+
+    Returns
+    -------
+    dict
+        A dict with the sequence as the key and the scores as the values.
+    '''
+    if isinstance(sequences, str):
+        sequences = [sequences]
+    payload = {'sequences': list(sequences), 'overlap_length': overlap_length, 'pad': pad,
+               'approach': approach, 'safe_mode': safe_mode, 'threshold': threshold, 'top_k': top_k}
+    return _post(payload, host=host, port=port, socket_path=socket_path, timeout=timeout)
+
+
+def predict_from_fasta_remote(path_to_fasta, overlap_length=39, pad='GS', approach='even', safe_mode=True,
+                              threshold=None, top_k=None, host='127.0.0.1', port=8765, socket_path=None,
+                              timeout=None):
+    '''
+    Predicts TAD scores for sequences in a (optionally gzip compressed) .fasta file using a running
+    prediction server (see tada-t2 serve). Mirrors TADA.predict_from_fasta().
+    Takes the same connection parameters as predict_remote().
+
+    Returns
+    -------
+    dict
+        Dict with name of the sequence from the fasta file as the key
+        and then a list as the values where the first element is the sequence
+        and the second element is the TADA scores.
+    '''
+    with open_fasta(path_to_fasta) as fh:
+        fasta = fh.read().decode()
+    payload = {'fasta': fasta, 'overlap_length': overlap_length, 'pad': pad,
+               'approach': approach, 'safe_mode': safe_mode, 'threshold': threshold, 'top_k': top_k}
+    return _post(payload, host=host, port=port, socket_path=socket_path, timeout=timeout)
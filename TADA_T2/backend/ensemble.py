@@ -0,0 +1,112 @@
+'''
+Code for scoring the same windows with several TadaModel weight files.
+Features are computed once per chunk and shared by every model.
+'''
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from tensorflow import convert_to_tensor
+
+from TADA_T2.backend.predictor import get_model, get_model_path, get_chunk_size, iter_feature_chunks, feature_shape
+from TADA_T2.backend import instrumentation
+from TADA_T2.backend import runtime
+
+# name -> weight file for every model scored by predict_ensemble() by default.
+registered_weights = {'tada.14-0.02': get_model_path()}
+
+
+def register_weights(name, weights_path):
+    '''
+    Function to add a weight file to the models used by predict_ensemble().
+
+    Parameters
+    ----------
+    name : str
+        Name used for this model in the results.
+    weights_path : str
+        Path to a weight file for the TadaModel architecture.
+    '''
+    registered_weights[name] = str(weights_path)
+
+
+def unregister_weights(name):
+    '''
+    Function to remove a weight file from the models used by predict_ensemble().
+
+    Parameters
+    ----------
+    name : str
+        Name the model was registered with.
+    '''
+    del registered_weights[name]
+
+
+def predict_ensemble(sequences, weights=None, model_threads=1, max_windows_per_chunk=None,
+                     max_memory=None, feature_store=None, feature_backend=None, batch_size=None,
+                     threads=None):
+    '''
+    Function to score a list of 40 amino acid sequences with several models.
+
+    Parameters
+    ----------
+    sequences : list
+        List of sequences to predict TADA scores for.
+    weights : dict or list, optional
+        Either a dict of name -> weight file or a list of weight files (named by path).
+        Default is None, which uses every registered weight file.
+    model_threads : int, optional
+        Number of models to run at the same time on each chunk. Default is 1.
+    max_windows_per_chunk : int, optional
+        Maximum number of sequences to featurize and predict at once.
+    max_memory : int, optional
+        Maximum number of bytes to use for features at once.
+    feature_store : str or FeatureStore, optional
+        Directory (or FeatureStore) to keep scaled features in between runs.
+    feature_backend : str, optional
+        Passed on to create_features(). Default is None (localCIDER).
+    batch_size : int or str, optional
+        Number of windows per model call or 'auto', as for predict_tada().
+    threads : int, optional
+        Number of Tensorflow intra-op threads, as for predict_tada().
+
+    Returns
+    -------
+    dict
+        Dict with 'scores' (a dict of model name -> array of TAD scores),
+        'mean' and 'std' (arrays of the mean and standard deviation over models).
+    '''
+    if not isinstance(sequences, list):
+        raise Exception('Sequences must be input as a list!')
+    if weights is None:
+        weights = dict(registered_weights)
+    elif not isinstance(weights, dict):
+        weights = {str(path): str(path) for path in weights}
+    if not weights:
+        raise ValueError('At least one weight file is needed.')
+
+    names = list(weights)
+    if threads is not None:
+        runtime.configure_threads(intra_op_threads=threads)
+    models = [get_model(weights[name]) for name in names]
+    instrumentation.count('windows', len(sequences))
+    scores = np.empty((len(names), len(sequences)), dtype=np.float32)
+    # every model has the same architecture, so one batch size suits them all.
+    batch_size = runtime.resolve_batch_size(batch_size, len(sequences), models[0], feature_shape())
+
+    def run_model(index, tensor, start):
+        with instrumentation.stage('model_predict'):
+            predictions = models[index].predict(tensor, batch_size=batch_size, verbose=0)
+            scores[index, start:start + tensor.shape[0]] = predictions[:, 0]
+
+    chunk_size = get_chunk_size(len(sequences), max_windows_per_chunk, max_memory)
+    with ThreadPoolExecutor(max_workers=max(1, model_threads)) as executor:
+        for start, features in iter_feature_chunks(sequences, chunk_size, feature_store=feature_store,
+                                                   feature_backend=feature_backend):
+            with instrumentation.stage('convert_to_tensor'):
+                tensor = convert_to_tensor(features)
+            # wait for every model before the feature buffer is reused.
+            list(executor.map(run_model, range(len(models)), [tensor] * len(models), [start] * len(models)))
+
+    return {'scores': dict(zip(names, scores)),
+            'mean': scores.mean(axis=0),
+            'std': scores.std(axis=0)}
@@ -0,0 +1,325 @@
+'''
+Code for reading records out of .fasta files, plain or gzip/bgzip
+compressed, either all at once or by seeking through a persistent index.
+'''
+import bisect
+import gzip
+import json
+import os
+import warnings
+import zlib
+
+import numpy as np
+
+VALID_AMINO_ACIDS = set('ACDEFGHIKLMNPQRSTVWY')
+
+# byte -> converted byte lookup used by convert_sequences(), making the same
+# conversions as protfasta with invalid_sequence_action='convert'. 0 marks
+# residues that are dropped and 255 marks residues that cannot be converted.
+_INVALID = 255
+_DROP = 0
+_BYTE_TABLE = np.full(256, _INVALID, dtype=np.uint8)
+for _aa in VALID_AMINO_ACIDS:
+    _BYTE_TABLE[ord(_aa)] = ord(_aa)
+    _BYTE_TABLE[ord(_aa.lower())] = ord(_aa)
+for _aa, _converted in {'B': 'N', 'U': 'C', 'X': 'G', 'Z': 'Q'}.items():
+    _BYTE_TABLE[ord(_aa)] = ord(_converted)
+    _BYTE_TABLE[ord(_aa.lower())] = ord(_converted)
+for _aa in '*- ':
+    _BYTE_TABLE[ord(_aa)] = _DROP
+
+# bump if the index layout changes so old index files get rebuilt.
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.tadaidx'
+
+
+def convert_sequences(sequences):
+    '''
+    Function to convert non-standard residues for many sequences at once.
+    All sequences are joined into one byte array and converted with a single
+    table lookup, which is much faster than converting them one at a time.
+
+    Parameters
+    ----------
+    sequences : list
+        List of sequences to convert.
+
+    Returns
+    -------
+    list
+        List of converted, upper-case sequences.
+    '''
+    if not sequences:
+        return []
+    joined = ''.join(sequences)
+    try:
+        residues = np.frombuffer(joined.encode('ascii'), dtype=np.uint8)
+    except UnicodeEncodeError:
+        raise ValueError('Sequences contain non-ASCII characters.')
+    converted = _BYTE_TABLE[residues]
+    invalid = converted == _INVALID
+    if invalid.any():
+        bad = sorted(set(residues[invalid].tobytes().decode()))
+        raise ValueError(f'Sequence contains invalid residues that could not be converted: {bad}')
+
+    keep = converted != _DROP
+    lengths = np.fromiter((len(sequence) for sequence in sequences), dtype=np.int64, count=len(sequences))
+    if keep.all():
+        new_lengths = lengths
+    else:
+        # number of kept residues per sequence.
+        ends = np.cumsum(lengths)
+        kept_before = np.concatenate([[0], np.cumsum(keep)])
+        new_lengths = kept_before[ends] - kept_before[ends - lengths]
+        converted = converted[keep]
+    text = converted.tobytes().decode('ascii')
+    bounds = np.concatenate([[0], np.cumsum(new_lengths)])
+    return [text[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def is_gzipped(path_to_fasta):
+    '''
+    Returns True if the file starts with the gzip magic number.
+    This covers both plain gzip and bgzip files.
+    '''
+    with open(path_to_fasta, 'rb') as fh:
+        return fh.read(2) == b'\x1f\x8b'
+
+
+def open_fasta(path_to_fasta):
+    '''
+    Opens a plain or gzip/bgzip compressed .fasta file for reading in binary mode.
+    '''
+    if is_gzipped(path_to_fasta):
+        return gzip.open(path_to_fasta, 'rb')
+    return open(path_to_fasta, 'rb')
+
+
+def parse_records(data):
+    '''
+    Function to parse the text of one or more .fasta records.
+
+    Parameters
+    ----------
+    data : str
+        Text of whole .fasta records.
+
+    Returns
+    -------
+    list
+        List of (header, sequence) with the sequences not yet converted.
+    '''
+    records = []
+    for block in data.split('\n>'):
+        if block.startswith('>'):
+            block = block[1:]
+        if not block.strip():
+            continue
+        header, _, sequence = block.partition('\n')
+        records.append((header.strip(), ''.join(sequence.split())))
+    return records
+
+
+def _gzip_members(path_to_fasta):
+    '''
+    Returns [compressed offset, uncompressed offset] for the start of every gzip
+    member in a file. bgzip files are made of many small members, which is
+    what makes seeking into them cheap.
+    '''
+    members = [[0, 0]]
+    compressed = 0
+    uncompressed = 0
+    decompressor = zlib.decompressobj(31)
+    with open(path_to_fasta, 'rb') as fh:
+        while True:
+            data = fh.read(1 << 20)
+            if not data:
+                break
+            while data:
+                uncompressed += len(decompressor.decompress(data))
+                if decompressor.eof:
+                    used = len(data) - len(decompressor.unused_data)
+                    compressed += used
+                    data = decompressor.unused_data
+                    decompressor = zlib.decompressobj(31)
+                    if data or fh.peek(1):
+                        members.append([compressed, uncompressed])
+                else:
+                    compressed += len(data)
+                    data = b''
+    return members
+
+
+class IndexedFasta:
+    '''
+    Random access to the records of a plain or gzip/bgzip compressed .fasta file.
+
+    The first time a file is opened an index of the byte range of every record
+    (and, for compressed files, of every gzip member) is written next to it.
+    Later opens read the index, so parallel workers can each seek straight to
+    their own records without reading the rest of the file.
+
+    Seeking is fast for plain and bgzip files. Plain gzip files are a single
+    gzip member, so reads still have to decompress from the start of the file.
+    '''
+    def __init__(self, path_to_fasta, index_path=None, rebuild=False):
+        '''
+        Parameters
+        ----------
+        path_to_fasta : str
+            path to a .fasta file as a string.
+        index_path : str, optional
+            Where to keep the index. Default is the .fasta path with .tadaidx appended.
+        rebuild : bool, optional
+            Whether to rebuild the index even if an up to date one exists.
+        '''
+        if not os.path.exists(path_to_fasta):
+            raise ValueError('Path does not exist.')
+        self.path = str(path_to_fasta)
+        self.index_path = index_path or self.path + INDEX_SUFFIX
+        self.compressed = is_gzipped(self.path)
+        index = None if rebuild else self._load_index()
+        if index is None:
+            index = self._build_index()
+        # size and mtime of the file the index describes.
+        self.fingerprint = index['fingerprint']
+        self.headers = [record[0] for record in index['records']]
+        self.starts = [record[1] for record in index['records']]
+        self.ends = [record[2] for record in index['records']]
+        self.member_compressed = [member[0] for member in index['members']]
+        self.member_uncompressed = [member[1] for member in index['members']]
+        if self.compressed and len(self.member_compressed) == 1 and len(self) > 1:
+            warnings.warn(f'{self.path} is a plain gzip file, so every read decompresses it from the start '
+                          'and reading it in chunks takes time quadratic in its size. '
+                          'Recompress it with bgzip (bgzip -c in.fasta > in.fasta.gz) for fast seeking.')
+
+    def _fingerprint(self):
+        stat = os.stat(self.path)
+        return {'version': INDEX_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return None
+        try:
+            with open(self.index_path) as fh:
+                index = json.load(fh)
+        except ValueError:
+            return None
+        if index.get('fingerprint') != self._fingerprint():
+            return None
+        return index
+
+    def _build_index(self):
+        records = []
+        offset = 0
+        header = None
+        start = 0
+        with open_fasta(self.path) as fh:
+            for line in fh:
+                if line.startswith(b'>'):
+                    if header is not None:
+                        records.append([header, start, offset])
+                    header = line[1:].decode().strip()
+                    start = offset
+                offset += len(line)
+        if header is not None:
+            records.append([header, start, offset])
+        members = _gzip_members(self.path) if self.compressed else [[0, 0]]
+        index = {'fingerprint': self._fingerprint(), 'members': members, 'records': records}
+        # write under a temporary name so readers never see a partial index.
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as fh:
+                json.dump(index, fh)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            # read-only location, keep the index in memory only.
+            pass
+        return index
+
+    def __len__(self):
+        return len(self.headers)
+
+    def _read_bytes(self, start, stop):
+        '''
+        Reads the uncompressed bytes in [start, stop).
+        '''
+        if not self.compressed:
+            with open(self.path, 'rb') as fh:
+                fh.seek(start)
+                return fh.read(stop - start)
+        member = bisect.bisect_right(self.member_uncompressed, start) - 1
+        skip = start - self.member_uncompressed[member]
+        needed = skip + stop - start
+        out = bytearray()
+        decompressor = zlib.decompressobj(31)
+        with open(self.path, 'rb') as fh:
+            fh.seek(self.member_compressed[member])
+            while len(out) < needed:
+                data = fh.read(1 << 16)
+                if not data:
+                    break
+                while data and len(out) < needed:
+                    out += decompressor.decompress(data)
+                    if decompressor.eof:
+                        data = decompressor.unused_data
+                        decompressor = zlib.decompressobj(31)
+                    else:
+                        data = b''
+        return bytes(out[skip:needed])
+
+    def read(self, start=0, stop=None):
+        '''
+        Reads records start to stop (like slicing a list) with one seek.
+
+        Returns
+        -------
+        list
+            List of (header, sequence) with non-standard residues converted.
+        '''
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if start >= stop:
+            return []
+        data = self._read_bytes(self.starts[start], self.ends[stop - 1]).decode()
+        records = parse_records(data)
+        sequences = convert_sequences([sequence for _, sequence in records])
+        return [(header, sequence) for (header, _), sequence in zip(records, sequences)]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('record index out of range')
+        return self.read(index, index + 1)[0]
+
+    def shard_range(self, shard_index, shard_total):
+        '''
+        Returns the (start, stop) record range for shard shard_index of shard_total.
+        Shards are contiguous and differ in size by at most one record.
+        '''
+        if shard_total < 1 or not 0 <= shard_index < shard_total:
+            raise ValueError('Shard index must satisfy 0 <= i < N.')
+        return (len(self) * shard_index // shard_total, len(self) * (shard_index + 1) // shard_total)
+
+
+def read_fasta(path_to_fasta):
+    '''
+    Function to read every record of a plain or gzip/bgzip compressed .fasta file.
+    Non-standard residues are converted in one vectorized pass.
+
+    Parameters
+    ----------
+    path_to_fasta : str
+        path to a .fasta file as a string
+
+    Returns
+    -------
+    dict
+        Dict of header -> sequence in file order.
+    '''
+    with open_fasta(path_to_fasta) as fh:
+        records = parse_records(fh.read().decode())
+    headers = [header for header, _ in records]
+    if len(set(headers)) != len(headers):
+        raise ValueError('The .fasta file contains duplicate headers.')
+    return dict(zip(headers, convert_sequences([sequence for _, sequence in records])))
@@ -0,0 +1,175 @@
+'''
+Code for keeping scaled feature tensors on disk so that the same
+windows do not have to be featurized again on later runs.
+'''
+import hashlib
+import os
+import sqlite3
+import uuid
+
+import numpy as np
+
+from TADA_T2.backend.features import create_features, scale_features_predict, get_scaler_path
+from TADA_T2.backend.kernels import resolve_backend
+from TADA_T2.backend import instrumentation
+
+# SQLite limits the number of parameters in one query.
+_QUERY_BATCH = 500
+
+
+class FeatureStore:
+    '''
+    A directory of memory-mapped .npy segment files holding scaled features,
+    with a SQLite index of the segment and row of every stored window.
+
+    Features are stored per window, so any later call that scores some of the
+    same windows reuses them, however the windows are split between calls.
+    Windows that are not stored yet are featurized and written as a new segment.
+    Segments are never changed once written.
+
+    Everything is kept under a subdirectory named after a hash of the feature
+    parameters, the feature scaler and the feature backend, so changing any of
+    them gives new entries instead of stale features.
+    '''
+    def __init__(self, directory, SEQUENCE_WINDOW=5, STEPS=1, LENGTH=40, PROPERTIES=42, backend=None):
+        '''
+        Parameters
+        ----------
+        directory : str
+            Directory to keep the feature files in. Created if it does not exist.
+        SEQUENCE_WINDOW, STEPS, LENGTH, PROPERTIES : int, optional
+            Same as for create_features().
+        backend : str, optional
+            Passed on to create_features(). Default is None (localCIDER).
+        '''
+        self.directory = str(directory)
+        self.SEQUENCE_WINDOW = SEQUENCE_WINDOW
+        self.STEPS = STEPS
+        self.LENGTH = LENGTH
+        self.PROPERTIES = PROPERTIES
+        self.backend = resolve_backend(backend)
+        digest = hashlib.sha256()
+        digest.update(f'{SEQUENCE_WINDOW},{STEPS},{LENGTH},{PROPERTIES},{self.backend}\n'.encode())
+        with open(get_scaler_path(), 'rb') as fh:
+            digest.update(hashlib.sha256(fh.read()).digest())
+        self.key = digest.hexdigest()
+        self.path = os.path.join(self.directory, self.key)
+        os.makedirs(self.path, exist_ok=True)
+        # the store can be opened in one thread and used in another (as the
+        # prediction server does), as long as only one thread uses it at a time.
+        self.connection = sqlite3.connect(os.path.join(self.path, 'index.sqlite'), check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS windows ('
+                                'window TEXT PRIMARY KEY, '
+                                'segment TEXT NOT NULL, '
+                                'row INTEGER NOT NULL)')
+        self.connection.commit()
+        # segment name -> read-only memory map.
+        self.segments = {}
+
+    @property
+    def shape(self):
+        '''
+        The (steps, properties) shape of the features for one window.
+        '''
+        return ((self.LENGTH - self.SEQUENCE_WINDOW) // self.STEPS + 1, self.PROPERTIES)
+
+    def _segment(self, name):
+        if name not in self.segments:
+            self.segments[name] = np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+        return self.segments[name]
+
+    def locate(self, sequences):
+        '''
+        Returns a dict of window -> (segment, row) for every stored window.
+        '''
+        windows = list(dict.fromkeys(sequences))
+        found = {}
+        for start in range(0, len(windows), _QUERY_BATCH):
+            batch = windows[start:start + _QUERY_BATCH]
+            rows = self.connection.execute(
+                f'SELECT window, segment, row FROM windows WHERE window IN ({",".join("?" * len(batch))})', batch)
+            for window, segment, row in rows:
+                found[window] = (segment, row)
+        return found
+
+    def _gather(self, sequences, locations):
+        features = np.empty((len(sequences),) + self.shape)
+        by_segment = {}
+        for position, sequence in enumerate(sequences):
+            segment, row = locations[sequence]
+            by_segment.setdefault(segment, []).append((row, position))
+        for segment, pairs in by_segment.items():
+            # read the rows of each segment in file order.
+            pairs.sort()
+            rows, positions = zip(*pairs)
+            features[list(positions)] = self._segment(segment)[list(rows)]
+        return features
+
+    def get(self, sequences):
+        '''
+        Returns the stored features for sequences as an array, or None if
+        any of them have not been stored yet.
+        '''
+        locations = self.locate(sequences)
+        if any(sequence not in locations for sequence in sequences):
+            return None
+        with instrumentation.stage('feature_store_read'):
+            return self._gather(sequences, locations)
+
+    def build(self, sequences, chunk_size=10000):
+        '''
+        Featurizes and scales sequences in chunks, writing each chunk straight
+        into a new on-disk segment, and adds them to the index.
+
+        Returns
+        -------
+        dict
+            window -> (segment, row) for the windows that were written.
+        '''
+        windows = list(dict.fromkeys(sequences))
+        if not windows:
+            return {}
+        name = uuid.uuid4().hex
+        path = os.path.join(self.path, name + '.npy')
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        features = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float64,
+                                             shape=(len(windows),) + self.shape)
+        buffer = np.empty((min(chunk_size, len(windows)),) + self.shape)
+        for start in range(0, len(windows), chunk_size):
+            chunk = windows[start:start + chunk_size]
+            chunk_features = buffer[:len(chunk)]
+            with instrumentation.stage('create_features'):
+                create_features(chunk, self.SEQUENCE_WINDOW, self.STEPS, self.LENGTH, self.PROPERTIES,
+                                out=chunk_features, backend=self.backend)
+            with instrumentation.stage('scale_features_predict'):
+                scale_features_predict(chunk_features, self.SEQUENCE_WINDOW, self.STEPS, self.LENGTH, inplace=True)
+            features[start:start + len(chunk)] = chunk_features
+        features.flush()
+        del features
+        # only show up under the final name once completely written.
+        os.replace(tmp_path, path)
+        with self.connection:
+            # another process may have stored some of the same windows meanwhile, keep theirs.
+            self.connection.executemany('INSERT OR IGNORE INTO windows VALUES (?, ?, ?)',
+                                        [(window, name, row) for row, window in enumerate(windows)])
+        return {window: (name, row) for row, window in enumerate(windows)}
+
+    def get_or_build(self, sequences, chunk_size=10000):
+        '''
+        Returns the features for sequences as an array, featurizing and
+        storing only the windows that are not stored yet.
+        '''
+        locations = self.locate(sequences)
+        missing = [sequence for sequence in dict.fromkeys(sequences) if sequence not in locations]
+        instrumentation.count('feature_store_hits', len(locations))
+        instrumentation.count('feature_store_misses', len(missing))
+        if missing:
+            locations.update(self.build(missing, chunk_size=chunk_size))
+        with instrumentation.stage('feature_store_read'):
+            return self._gather(sequences, locations)
+
+    def close(self):
+        '''
+        Closes the index.
+        '''
+        self.connection.close()
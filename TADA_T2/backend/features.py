@@ -9,6 +9,8 @@ import numpy as np
 import alphaPredict as alpha
 from localcider.sequenceParameters import SequenceParameters
 
+from TADA_T2.backend import instrumentation
+
 
 def get_scaler_path():
     ''' 
@@ -18,7 +20,7 @@ def get_scaler_path():
     return str(scaler_arr_path)
 
 
-def create_features(sequences, SEQUENCE_WINDOW = 5, STEPS = 1, LENGTH = 40, PROPERTIES = 42):
+def create_features(sequences, SEQUENCE_WINDOW = 5, STEPS = 1, LENGTH = 40, PROPERTIES = 42, out=None, backend=None):
     '''
     Function to create features for the model. Updated to improve readability.
 
@@ -34,11 +36,24 @@ def create_features(sequences, SEQUENCE_WINDOW = 5, STEPS = 1, LENGTH = 40, PROP
         The length of the sequences. 
     PROPERTIES : Int, optional
         The number of properties
+    out : np.ndarray, optional
+        Preallocated array of shape (len(sequences), (LENGTH - SEQUENCE_WINDOW) // STEPS + 1, PROPERTIES)
+        to write the features into. Lets callers reuse one buffer across batches.
+    backend : str, optional
+        None (default) computes every feature with localCIDER as below.
+        'numba', 'numpy' or 'auto' use the fused kernels in TADA_T2.backend.kernels
+        instead, which give the same features ('auto' picks Numba when it is
+        installed). Kappa, omega and helicity still come from localCIDER and
+        alphaPredict there, so most of the time is spent in the same place.
     
     Returns
     -------
     features : Processed input data for model
     '''
+    if backend is not None:
+        from TADA_T2.backend.kernels import create_features_fused
+        return create_features_fused(sequences, SEQUENCE_WINDOW, STEPS, LENGTH, PROPERTIES, out=out,
+                                     backend=None if backend == 'auto' else backend)
 
     aliphatics_set = set(['I', 'V', 'L', 'A'])
     aromatics_set = set(['W', 'F', 'Y'])
@@ -53,56 +68,76 @@ def create_features(sequences, SEQUENCE_WINDOW = 5, STEPS = 1, LENGTH = 40, PROP
     tinys_set = set(['G', 'A', 'S', 'P'])
     amino_acids = ['R', 'K', 'D', 'E', 'Q', 'N', 'H', 'S', 'T', 'Y', 'C', 'W', 'M', 'A', 'I', 'L', 'F', 'V', 'P', 'G']
 
-    features = []        
-    for sequence in sequences:
+    num_steps = (LENGTH - SEQUENCE_WINDOW) // STEPS + 1
+    if out is None:
+        out = np.zeros((len(sequences), num_steps, PROPERTIES))
+    elif out.shape != (len(sequences), num_steps, PROPERTIES):
+        raise ValueError(f'out must have shape {(len(sequences), num_steps, PROPERTIES)}, got {out.shape}.')
+
+    for seq_index, sequence in enumerate(sequences):
         SEQUENCE_LENGTH = len(sequence)
-        SeqOb = SequenceParameters(sequence)
-        kappa = np.full(int((SEQUENCE_LENGTH-SEQUENCE_WINDOW)/STEPS+1), SeqOb.get_kappa())
-        omega = np.full(int((SEQUENCE_LENGTH-SEQUENCE_WINDOW)/STEPS+1), SeqOb.get_Omega())
+        with instrumentation.stage('create_features.localcider'):
+            SeqOb = SequenceParameters(sequence)
+            kappa = np.full(int((SEQUENCE_LENGTH-SEQUENCE_WINDOW)/STEPS+1), SeqOb.get_kappa())
+            omega = np.full(int((SEQUENCE_LENGTH-SEQUENCE_WINDOW)/STEPS+1), SeqOb.get_Omega())
         
         # make subseqs.
         sub_seq = [sequence[STEPS * j:STEPS * j + SEQUENCE_WINDOW] for j in range((SEQUENCE_LENGTH - SEQUENCE_WINDOW) // STEPS + 1)]
-        one = np.array([sum(aa in aliphatics_set for aa in seq) for seq in sub_seq])
-        two = np.array([sum(aa in aromatics_set for aa in seq) for seq in sub_seq])
-        three = np.array([sum(aa in branching_set for aa in seq) for seq in sub_seq])
-        four = np.array([sum(aa in charged_set for aa in seq) for seq in sub_seq])
-        five = np.array([sum(aa in negatives_set for aa in seq) for seq in sub_seq])
-        six = np.array([sum(aa in phosphorylatables_set for aa in seq) for seq in sub_seq])
-        seven = np.array([sum(aa in polars_set for aa in seq) for seq in sub_seq])
-        eight = np.array([sum(aa in hydrophobics_set for aa in seq) for seq in sub_seq])
-        nine = np.array([sum(aa in positives_set for aa in seq) for seq in sub_seq])
-        ten = np.array([sum(aa in sulfurcontaining_set for aa in seq) for seq in sub_seq])
-        eleven = np.array([sum(aa in tinys_set for aa in seq) for seq in sub_seq])
-        sstructure = np.array([sum(alpha.predict(seq)) / len(seq) for seq in sub_seq])
-        count_20 = np.array([[s.count(aa) for s in sub_seq] for aa in amino_acids])
+        with instrumentation.stage('create_features.counting'):
+            one = np.array([sum(aa in aliphatics_set for aa in seq) for seq in sub_seq])
+            two = np.array([sum(aa in aromatics_set for aa in seq) for seq in sub_seq])
+            three = np.array([sum(aa in branching_set for aa in seq) for seq in sub_seq])
+            four = np.array([sum(aa in charged_set for aa in seq) for seq in sub_seq])
+            five = np.array([sum(aa in negatives_set for aa in seq) for seq in sub_seq])
+            six = np.array([sum(aa in phosphorylatables_set for aa in seq) for seq in sub_seq])
+            seven = np.array([sum(aa in polars_set for aa in seq) for seq in sub_seq])
+            eight = np.array([sum(aa in hydrophobics_set for aa in seq) for seq in sub_seq])
+            nine = np.array([sum(aa in positives_set for aa in seq) for seq in sub_seq])
+            ten = np.array([sum(aa in sulfurcontaining_set for aa in seq) for seq in sub_seq])
+            eleven = np.array([sum(aa in tinys_set for aa in seq) for seq in sub_seq])
+            count_20 = np.array([[s.count(aa) for s in sub_seq] for aa in amino_acids])
+        with instrumentation.stage('create_features.alphapredict'):
+            sstructure = np.array([sum(alpha.predict(seq)) / len(seq) for seq in sub_seq])
         
         # turn subseqs into SeqObs.
-        sub_seq = [SequenceParameters(seq) for seq in sub_seq]
-        hydropathy = np.array([seq.get_mean_hydropathy() for seq in sub_seq])
-        hydropathy_ww = np.array([seq.get_WW_hydropathy() for seq in sub_seq])
-        ncpr = np.array([seq.get_NCPR() for seq in sub_seq])
-        promoting = np.array([seq.get_fraction_disorder_promoting() for seq in sub_seq])
-        fcr = np.array([seq.get_FCR() for seq in sub_seq])
-        charge = np.array([seq.get_mean_net_charge() for seq in sub_seq])
-        negative = np.array([seq.get_fraction_negative() for seq in sub_seq])
-        positive = np.array([seq.get_fraction_positive() for seq in sub_seq])
+        with instrumentation.stage('create_features.localcider'):
+            sub_seq = [SequenceParameters(seq) for seq in sub_seq]
+            hydropathy = np.array([seq.get_mean_hydropathy() for seq in sub_seq])
+            hydropathy_ww = np.array([seq.get_WW_hydropathy() for seq in sub_seq])
+            ncpr = np.array([seq.get_NCPR() for seq in sub_seq])
+            promoting = np.array([seq.get_fraction_disorder_promoting() for seq in sub_seq])
+            fcr = np.array([seq.get_FCR() for seq in sub_seq])
+            charge = np.array([seq.get_mean_net_charge() for seq in sub_seq])
+            negative = np.array([seq.get_fraction_negative() for seq in sub_seq])
+            positive = np.array([seq.get_fraction_positive() for seq in sub_seq])
 
         # make array of features.
         x = np.array([kappa, omega, hydropathy, hydropathy_ww, ncpr, promoting, fcr, charge, negative, positive,
                      one, two, three, four, five, six, seven, eight, nine, ten, eleven, sstructure])
         # concatenate x and count_20
         x = np.concatenate([x, count_20])
-        # do padding 
-        padded_x = np.zeros((PROPERTIES, (LENGTH - SEQUENCE_WINDOW) // STEPS + 1))
-        padded_x[:x.shape[0], :x.shape[1]] = x
-        # append to features
-        features.append(padded_x)
+        # write transposed into the output, leaving the padding as zeros.
+        out[seq_index] = 0
+        out[seq_index, :x.shape[1], :x.shape[0]] = x.T
+
+    return out
 
-    features = np.array(features)
-    return np.transpose(features, (0, 2, 1))
 
+# trying to avoid reloading the scaler every call
+scaler_cache = None
 
-def scale_features_predict(features: np.ndarray, SEQUENCE_WINDOW=5, STEPS=1, LENGTH=40) -> np.ndarray:
+
+def get_scaler_metric():
+    '''
+    Returns the scaler metric array, loading it from disk the first time.
+    '''
+    global scaler_cache
+    if scaler_cache is None:
+        scaler_cache = np.load(str(get_scaler_path()))
+    return scaler_cache
+
+
+def scale_features_predict(features: np.ndarray, SEQUENCE_WINDOW=5, STEPS=1, LENGTH=40, inplace=False) -> np.ndarray:
     '''
     Function to scale the features for prediction. Updated to improve readability.
 
@@ -110,6 +145,9 @@ def scale_features_predict(features: np.ndarray, SEQUENCE_WINDOW=5, STEPS=1, LEN
     ----------
     features : np.ndarray
         Takes the output of create_features() and scales the values per feature column.
+    inplace : bool, optional
+        Whether to scale features in place instead of scaling a copy.
+        Default is False.
 
     Returns
     -------
@@ -117,28 +155,24 @@ def scale_features_predict(features: np.ndarray, SEQUENCE_WINDOW=5, STEPS=1, LEN
         Scaled feature array ready for prediction.
     '''
 
-    scaled_array_copy = deepcopy(features)
-    n, m = features[0].shape
-    scaler_metric = np.load(str(get_scaler_path()))
-
+    scaled_array_copy = features if inplace else deepcopy(features)
+    m = features.shape[2]
+    scaler_metric = get_scaler_metric()
 
-    # Precompute the length for reshaping
-    num_steps = int((LENGTH - SEQUENCE_WINDOW) / STEPS + 1)
-    
-    for i in range(m):
-        # Load StandardScaler and MinMaxScaler parameters for each feature
-        mean_, var_, scale_, n_samples_seen_ = scaler_metric[i, :4]
-        min_, data_min_, data_max_, scale2_, n_samples_seen2_, data_range_ = scaler_metric[i, 4:10]
-        
-        # Normalize using StandardScaler metrics
-        results = (scaled_array_copy[:, :, i] - mean_) / scale_
+    # StandardScaler (mean_, scale_) and MinMaxScaler (data_min_, data_range_) parameters
+    # for each feature column, broadcast over the last axis.
+    mean_ = scaler_metric[:m, 0]
+    scale_ = scaler_metric[:m, 2]
+    data_min_ = scaler_metric[:m, 5]
+    data_range_ = scaler_metric[:m, 9]
 
-        # Apply MinMaxScaler metrics
-        results = (results - data_min_) / data_range_
+    # Normalize using StandardScaler metrics
+    scaled_array_copy -= mean_
+    scaled_array_copy /= scale_
 
-        # Reshape back to original dimensions
-        results = results.reshape((len(features), num_steps))
-        scaled_array_copy[:, :, i] = results
+    # Apply MinMaxScaler metrics
+    scaled_array_copy -= data_min_
+    scaled_array_copy /= data_range_
 
     return scaled_array_copy
 
@@ -0,0 +1,169 @@
+'''
+Lightweight instrumentation for the prediction pipeline.
+
+Usage example::
+
+    from TADA_T2.TADA import predict, instrument
+
+    with instrument() as stats:
+        predict(sequences)
+    print(stats.as_dict())
+    print(stats.to_prometheus())
+
+When no instrument() block is active every hook returns immediately,
+so the cost of leaving the hooks in the pipeline is a global lookup.
+'''
+import json
+import time
+
+# the Instrumentation currently collecting, or None when disabled.
+_active = None
+
+
+class _NullStage:
+    '''
+    Stage used when instrumentation is disabled. Does nothing.
+    '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    '''
+    Times one pass through a named stage.
+    '''
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Instrumentation:
+    '''
+    Collects per-stage wall times, counters and peak values.
+    '''
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self.peaks = {}
+        self._previous = None
+
+    def add_time(self, name, seconds):
+        '''
+        Adds wall time (in seconds) to a stage.
+        '''
+        total, calls = self.timings.get(name, (0.0, 0))
+        self.timings[name] = (total + seconds, calls + 1)
+
+    def count(self, name, value=1):
+        '''
+        Adds value to a counter.
+        '''
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def peak(self, name, value):
+        '''
+        Records value if it is the largest seen so far for name.
+        '''
+        if value > self.peaks.get(name, value - 1):
+            self.peaks[name] = value
+
+    def as_dict(self):
+        '''
+        Returns everything collected as a plain dict.
+        '''
+        return {'timings': {name: {'seconds': total, 'calls': calls}
+                            for name, (total, calls) in self.timings.items()},
+                'counters': dict(self.counters),
+                'peaks': dict(self.peaks)}
+
+    def to_json(self, **kwargs):
+        '''
+        Returns everything collected as a JSON string.
+        '''
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def to_prometheus(self, prefix='tada_t2'):
+        '''
+        Returns everything collected in the Prometheus text exposition format.
+        '''
+        lines = [f'# TYPE {prefix}_stage_seconds_total counter',
+                 f'# TYPE {prefix}_stage_calls_total counter']
+        for name, (total, calls) in self.timings.items():
+            lines.append(f'{prefix}_stage_seconds_total{{stage="{name}"}} {total:.9g}')
+            lines.append(f'{prefix}_stage_calls_total{{stage="{name}"}} {calls}')
+        for name, value in self.counters.items():
+            metric = f'{prefix}_{_metric_name(name)}_total'
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric} {value}')
+        for name, value in self.peaks.items():
+            metric = f'{prefix}_{_metric_name(name)}_max'
+            lines.append(f'# TYPE {metric} gauge')
+            lines.append(f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        _active = self
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        _active = self._previous
+        self._previous = None
+        return False
+
+
+def _metric_name(name):
+    '''
+    Makes a name safe to use as part of a Prometheus metric name.
+    '''
+    return ''.join(char if char.isalnum() else '_' for char in name)
+
+
+def instrument():
+    '''
+    Returns a new Instrumentation to use as a context manager.
+    Everything run inside the with block is recorded into it.
+    '''
+    return Instrumentation()
+
+
+def stage(name):
+    '''
+    Returns a context manager that times the named stage
+    if instrumentation is enabled.
+    '''
+    if _active is None:
+        return _NULL_STAGE
+    return _Stage(_active, name)
+
+
+def count(name, value=1):
+    '''
+    Adds value to the named counter if instrumentation is enabled.
+    '''
+    if _active is not None:
+        _active.count(name, value)
+
+
+def peak(name, value):
+    '''
+    Records value for the named peak if instrumentation is enabled.
+    '''
+    if _active is not None:
+        _active.peak(name, value)
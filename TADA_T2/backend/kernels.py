@@ -0,0 +1,217 @@
+'''
+Fused feature kernels. An optional way to compute the same features as
+create_features() with fewer localCIDER calls.
+
+All of the per-window features except kappa, omega and the alphaPredict helicity
+are sums (counts) or means (localCIDER scales and fractions) of per-residue values.
+They are looked up from one (20, 42) residue table and summed over each window in
+a single pass that writes straight into the (N, 36, 42) output. The table for the
+localCIDER columns is built from localCIDER itself and checked against it, so
+any column that does not match falls back to localCIDER.
+
+Kappa and omega are per sequence and are computed once for each unique sequence.
+Helicity only depends on the 5 residue window, so it is cached per window.
+These three still go through localCIDER and alphaPredict one call at a time
+and take almost all of the time, the summing kernel itself is cheap.
+
+If Numba is installed the summing kernel is JIT compiled, otherwise a
+vectorized NumPy version is used.
+'''
+import functools
+
+import numpy as np
+import alphaPredict as alpha
+from localcider.sequenceParameters import SequenceParameters
+
+from TADA_T2.backend import instrumentation
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+AMINO_ACIDS = ['R', 'K', 'D', 'E', 'Q', 'N', 'H', 'S', 'T', 'Y', 'C', 'W', 'M', 'A', 'I', 'L', 'F', 'V', 'P', 'G']
+
+# column order of create_features(). Columns 10-20 are the residue class counts
+# and 22-41 the counts of each amino acid in AMINO_ACIDS order.
+KAPPA, OMEGA, CHARGE, SSTRUCTURE = 0, 1, 7, 21
+LINEAR_COLUMNS = {2: 'get_mean_hydropathy', 3: 'get_WW_hydropathy', 4: 'get_NCPR',
+                  5: 'get_fraction_disorder_promoting', 6: 'get_FCR', 8: 'get_fraction_negative',
+                  9: 'get_fraction_positive'}
+NCPR = 4
+CLASS_SETS = [set('IVLA'), set('WFY'), set('VIT'), set('KRHDE'), set('DE'), set('STY'),
+              set('RKDEQNY'), set('WFLVICM'), set('KRH'), set('MC'), set('GASP')]
+
+# byte -> row of the residue table, 255 for anything that is not a standard residue.
+_CODES = np.full(256, 255, dtype=np.uint8)
+for _index, _aa in enumerate(AMINO_ACIDS):
+    _CODES[ord(_aa)] = _index
+
+
+def available_backends():
+    '''
+    Returns the kernel backends that can be used here.
+    '''
+    return ['numba', 'numpy'] if numba is not None else ['numpy']
+
+
+def resolve_backend(backend):
+    '''
+    Returns the backend create_features() will use for a backend argument:
+    None for localCIDER, or the kernel backend 'auto' stands for.
+    '''
+    if backend == 'auto':
+        return available_backends()[0]
+    return backend
+
+
+@functools.lru_cache(maxsize=None)
+def residue_table(SEQUENCE_WINDOW=5, PROPERTIES=42):
+    '''
+    Builds the (20, PROPERTIES) table of per-residue values that sum to each
+    window feature, and checks the localCIDER columns against localCIDER.
+
+    Returns
+    -------
+    tuple
+        (table, fallback_columns) where fallback_columns maps the columns that
+        did not match localCIDER to the localCIDER method to use instead.
+    '''
+    table = np.zeros((len(AMINO_ACIDS), PROPERTIES))
+    for row, aa in enumerate(AMINO_ACIDS):
+        homopolymer = SequenceParameters(aa * SEQUENCE_WINDOW)
+        # a homopolymer gives the per-residue value of a mean and the window
+        # total of a sum, so dividing by the window length works for both.
+        for column, getter in LINEAR_COLUMNS.items():
+            table[row, column] = getattr(homopolymer, getter)() / SEQUENCE_WINDOW
+        for offset, class_set in enumerate(CLASS_SETS):
+            table[row, 10 + offset] = aa in class_set
+        table[row, 22 + row] = 1
+
+    # check the table against localCIDER on random windows.
+    rng = np.random.default_rng(0)
+    fallback_columns = {}
+    for _ in range(64):
+        window = ''.join(rng.choice(AMINO_ACIDS, SEQUENCE_WINDOW))
+        values = table[[AMINO_ACIDS.index(aa) for aa in window]].sum(axis=0)
+        SeqOb = SequenceParameters(window)
+        for column, getter in list(LINEAR_COLUMNS.items()) + [(CHARGE, 'get_mean_net_charge')]:
+            value = abs(values[NCPR]) if column == CHARGE else values[column]
+            if not np.isclose(value, getattr(SeqOb, getter)(), rtol=1e-9, atol=1e-12):
+                fallback_columns[column] = getter
+    return table, fallback_columns
+
+
+@functools.lru_cache(maxsize=1 << 20)
+def _helicity(window):
+    '''
+    Mean alphaPredict helicity of a window, cached because neighbouring
+    sequence windows share almost all of their sub-windows.
+    '''
+    return sum(alpha.predict(window)) / len(window)
+
+
+def _sum_windows_numpy(codes, table, out, SEQUENCE_WINDOW, STEPS):
+    '''
+    Sums table rows over every window of equal-length encoded sequences.
+    '''
+    num_windows = (codes.shape[1] - SEQUENCE_WINDOW) // STEPS + 1
+    # running sum over residues, window sums are differences of it.
+    running = np.zeros((codes.shape[0], codes.shape[1] + 1, table.shape[1]))
+    np.cumsum(table[codes], axis=1, out=running[:, 1:])
+    starts = np.arange(num_windows) * STEPS
+    out[:, :num_windows] = running[:, starts + SEQUENCE_WINDOW] - running[:, starts]
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _sum_windows_numba(codes, table, out, SEQUENCE_WINDOW, STEPS):
+        num_windows = (codes.shape[1] - SEQUENCE_WINDOW) // STEPS + 1
+        num_columns = table.shape[1]
+        totals = np.zeros(num_columns)
+        for n in range(codes.shape[0]):
+            for j in range(num_windows):
+                totals[:] = 0.0
+                for k in range(SEQUENCE_WINDOW):
+                    row = codes[n, j * STEPS + k]
+                    for c in range(num_columns):
+                        totals[c] += table[row, c]
+                for c in range(num_columns):
+                    out[n, j, c] = totals[c]
+
+
+def create_features_fused(sequences, SEQUENCE_WINDOW=5, STEPS=1, LENGTH=40, PROPERTIES=42,
+                          out=None, dtype=np.float32, backend=None):
+    '''
+    Computes the same features as create_features() with fused kernels.
+
+    Parameters
+    ----------
+    sequences : list
+        List of sequences with max length of 40AA.
+    SEQUENCE_WINDOW, STEPS, LENGTH, PROPERTIES : int, optional
+        Same as for create_features().
+    out : np.ndarray, optional
+        Preallocated (len(sequences), steps, PROPERTIES) array to write into.
+    dtype : np.dtype, optional
+        dtype of the output when out is not given. Default is float32.
+    backend : str, optional
+        'numba' or 'numpy'. Default is None, which uses Numba when it is installed.
+
+    Returns
+    -------
+    np.ndarray
+        (len(sequences), steps, PROPERTIES) features.
+    '''
+    if backend is None:
+        backend = available_backends()[0]
+    if backend not in available_backends():
+        raise ValueError(f'backend must be one of {available_backends()}, got {backend}.')
+    num_steps = (LENGTH - SEQUENCE_WINDOW) // STEPS + 1
+    if out is None:
+        out = np.zeros((len(sequences), num_steps, PROPERTIES), dtype=dtype)
+    elif out.shape != (len(sequences), num_steps, PROPERTIES):
+        raise ValueError(f'out must have shape {(len(sequences), num_steps, PROPERTIES)}, got {out.shape}.')
+    table, fallback_columns = residue_table(SEQUENCE_WINDOW, PROPERTIES)
+
+    # group sequences by length so each group is one rectangular array.
+    by_length = {}
+    for index, sequence in enumerate(sequences):
+        by_length.setdefault(len(sequence), []).append(index)
+
+    sum_windows = _sum_windows_numba if backend == 'numba' else _sum_windows_numpy
+    with instrumentation.stage('create_features.kernel'):
+        for length, indices in by_length.items():
+            codes = _CODES[np.frombuffer(''.join(sequences[i] for i in indices).encode('ascii'),
+                                         dtype=np.uint8)].reshape(len(indices), length)
+            if (codes == 255).any():
+                raise ValueError('Sequences must only contain the 20 standard amino acids.')
+            # with one length (the usual case) the kernel writes straight into out.
+            target = out if len(indices) == len(sequences) else np.zeros((len(indices), num_steps, PROPERTIES))
+            sum_windows(codes, table, target, SEQUENCE_WINDOW, STEPS)
+            target[:, :, CHARGE] = np.abs(target[:, :, NCPR])
+            num_windows = max(0, (length - SEQUENCE_WINDOW) // STEPS + 1)
+            target[:, num_windows:] = 0
+            if target is not out:
+                out[indices] = target
+
+    with instrumentation.stage('create_features.localcider'):
+        # kappa and omega once per unique sequence.
+        parameters = {}
+        for index, sequence in enumerate(sequences):
+            if sequence not in parameters:
+                SeqOb = SequenceParameters(sequence)
+                parameters[sequence] = (SeqOb.get_kappa(), SeqOb.get_Omega())
+            num_windows = (len(sequence) - SEQUENCE_WINDOW) // STEPS + 1
+            out[index, :num_windows, KAPPA], out[index, :num_windows, OMEGA] = parameters[sequence]
+            for column, getter in fallback_columns.items():
+                out[index, :num_windows, column] = [
+                    getattr(SequenceParameters(sequence[STEPS * j:STEPS * j + SEQUENCE_WINDOW]), getter)()
+                    for j in range(num_windows)]
+
+    with instrumentation.stage('create_features.alphapredict'):
+        for index, sequence in enumerate(sequences):
+            num_windows = (len(sequence) - SEQUENCE_WINDOW) // STEPS + 1
+            out[index, :num_windows, SSTRUCTURE] = [
+                _helicity(sequence[STEPS * j:STEPS * j + SEQUENCE_WINDOW]) for j in range(num_windows)]
+    return out
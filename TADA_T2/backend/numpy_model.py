@@ -0,0 +1,185 @@
+'''
+NumPy implementation of the TADA model forward pass.
+
+Gives the same scores as the Tensorflow model (to float32 precision) using
+only NumPy. The weights are read straight from the .hdf5 weight file with h5py,
+so the model can be loaded and used in processes that never touch Tensorflow.
+'''
+import importlib.resources
+
+import numpy as np
+
+try:
+    from scipy.special import erf
+except ImportError:
+    erf = None
+
+
+def _erf(x):
+    '''
+    Error function. Uses scipy if it is installed, otherwise the
+    Abramowitz and Stegun 7.1.26 approximation (absolute error < 1.5e-7,
+    below float32 precision).
+    '''
+    if erf is not None:
+        return erf(x)
+    sign = np.sign(x)
+    x = np.abs(x)
+    t = 1 / (1 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sign * (1 - poly * np.exp(-x * x))
+
+
+def gelu(x):
+    '''
+    Exact (erf based) GELU, the Keras default.
+    '''
+    return 0.5 * x * (1 + _erf(x / np.sqrt(2).astype(x.dtype)))
+
+
+def sigmoid(x):
+    # tanh form of the logistic function, does not overflow for large |x|.
+    return 0.5 * (1 + np.tanh(0.5 * x))
+
+
+def softmax(x, axis=-1):
+    e = np.exp(x - x.max(axis=axis, keepdims=True))
+    return e / e.sum(axis=axis, keepdims=True)
+
+
+def conv1d(x, kernel, bias):
+    '''
+    'valid' 1D convolution with stride 1 followed by GELU.
+    x is (N, T, C_in), kernel is (kernel_size, C_in, C_out).
+    '''
+    kernel_size = kernel.shape[0]
+    steps = x.shape[1] - kernel_size + 1
+    out = x[:, :steps] @ kernel[0]
+    for k in range(1, kernel_size):
+        out += x[:, k:k + steps] @ kernel[k]
+    out += bias
+    return gelu(out)
+
+
+def lstm(x, kernel, recurrent_kernel, bias, reverse=False):
+    '''
+    Keras LSTM (gate order i, f, c, o) over x (N, T, C).
+    Returns the (N, T, units) hidden states in input time order.
+    '''
+    units = recurrent_kernel.shape[0]
+    # the input part of every gate for every time step in one matmul.
+    inputs = x @ kernel + bias
+    h = np.zeros((x.shape[0], units), dtype=x.dtype)
+    c = np.zeros_like(h)
+    states = np.empty((x.shape[0], x.shape[1], units), dtype=x.dtype)
+    time_steps = range(x.shape[1] - 1, -1, -1) if reverse else range(x.shape[1])
+    for t in time_steps:
+        z = inputs[:, t] + h @ recurrent_kernel
+        i = sigmoid(z[:, :units])
+        f = sigmoid(z[:, units:2 * units])
+        g = np.tanh(z[:, 2 * units:3 * units])
+        o = sigmoid(z[:, 3 * units:])
+        c = f * c + i * g
+        h = o * np.tanh(c)
+        states[:, t] = h
+    return states
+
+
+class NumpyTadaModel:
+    '''
+    The TADA model with its weights held in NumPy arrays.
+
+    All weights are views into one contiguous float32 buffer, so processes
+    forked after the model is built share it copy-on-write without copying.
+    '''
+    # number of weight arrays of each layer with weights, in model order.
+    LAYER_WEIGHT_COUNTS = [('conv1', 2), ('conv2', 2), ('attention', 2),
+                           ('bilstm1', 6), ('bilstm2', 6), ('dense', 2)]
+
+    def __init__(self, weights):
+        '''
+        Parameters
+        ----------
+        weights : list
+            The weight arrays of the model in the order of model.get_weights().
+        '''
+        expected = sum(count for _, count in self.LAYER_WEIGHT_COUNTS)
+        if len(weights) != expected:
+            raise ValueError(f'Expected {expected} weight arrays for the TADA model, got {len(weights)}.')
+        weights = [np.asarray(w, dtype=np.float32) for w in weights]
+        self.buffer = np.empty(sum(w.size for w in weights), dtype=np.float32)
+        views = []
+        offset = 0
+        for w in weights:
+            view = self.buffer[offset:offset + w.size].reshape(w.shape)
+            view[...] = w
+            views.append(view)
+            offset += w.size
+        self.buffer.flags.writeable = False
+        self.layers = {}
+        for name, count in self.LAYER_WEIGHT_COUNTS:
+            self.layers[name], views = views[:count], views[count:]
+
+    @classmethod
+    def from_keras(cls, model):
+        '''
+        Builds the NumPy model from a loaded Keras TADA model.
+        '''
+        return cls(model.get_weights())
+
+    @classmethod
+    def from_hdf5(cls, weights_path=None):
+        '''
+        Builds the NumPy model from a Keras .hdf5 weight file without Tensorflow.
+
+        Parameters
+        ----------
+        weights_path : str, optional
+            Path to a weight file for the TadaModel architecture.
+            Default is None, which uses the bundled tada.14-0.02.hdf5 weights.
+        '''
+        import h5py
+
+        if weights_path is None:
+            weights_path = importlib.resources.files('TADA_T2.data') / 'tada.14-0.02.hdf5'
+        weights = []
+        with h5py.File(str(weights_path), 'r') as fh:
+            # files written by model.save() keep the weights in a subgroup.
+            group = fh['model_weights'] if 'model_weights' in fh else fh
+            # same layout Keras reads in load_weights(): layers in model order,
+            # each with its weights in layer.get_weights() order.
+            for layer_name in group.attrs['layer_names']:
+                layer = group[layer_name.decode() if isinstance(layer_name, bytes) else layer_name]
+                for weight_name in layer.attrs['weight_names']:
+                    weight_name = weight_name.decode() if isinstance(weight_name, bytes) else weight_name
+                    weights.append(np.asarray(layer[weight_name]))
+        return cls(weights)
+
+    def __call__(self, features):
+        x = np.asarray(features, dtype=np.float32)
+        x = conv1d(x, *self.layers['conv1'])
+        x = conv1d(x, *self.layers['conv2'])
+        # dropout does nothing at inference.
+        W, b = self.layers['attention']
+        x = x * softmax(np.tanh(x @ W + b), axis=1)
+        forward, backward = self.layers['bilstm1'][:3], self.layers['bilstm1'][3:]
+        x = np.concatenate([lstm(x, *forward), lstm(x, *backward, reverse=True)], axis=-1)
+        forward, backward = self.layers['bilstm2'][:3], self.layers['bilstm2'][3:]
+        # without return_sequences each direction returns its final state.
+        x = np.concatenate([lstm(x, *forward)[:, -1], lstm(x, *backward, reverse=True)[:, 0]], axis=-1)
+        W, b = self.layers['dense']
+        return softmax(x @ W + b)
+
+    def predict(self, features, batch_size=32, verbose=0):
+        '''
+        Scores features in batches. Same signature as the Keras model's predict().
+
+        Returns
+        -------
+        np.ndarray
+            (N, 2) softmax outputs.
+        '''
+        out = np.empty((len(features), 2), dtype=np.float32)
+        for start in range(0, len(features), batch_size):
+            out[start:start + batch_size] = self(features[start:start + batch_size])
+        return out
@@ -2,12 +2,19 @@
 code for predictor.
 '''
 import importlib.resources
+
+import numpy as np
 from tensorflow import convert_to_tensor
 
 
 # package imports
 from TADA_T2.backend.features import create_features, scale_features_predict
 from TADA_T2.backend.model import TadaModel
+from TADA_T2.backend.feature_store import FeatureStore
+from TADA_T2.backend.kernels import resolve_backend
+from TADA_T2.backend import instrumentation
+from TADA_T2.backend import runtime
+from TADA_T2.backend.workers import WorkerPool, get_worker_pool
 
 def get_model_path():
     ''' 
@@ -19,7 +26,158 @@ def get_model_path():
 # trying to avoid recreating the model multiple times
 model_cache = None  # Global variable to store the model
 
-def predict_tada(sequences, return_both_values=False):
+# Defines the sequence window size and steps (stride length). Change values if needed.
+SEQUENCE_WINDOW = 5
+STEPS = 1
+LENGTH = 40
+PROPERTIES = 42
+
+# default cap on the number of windows featurized and predicted at once.
+DEFAULT_MAX_WINDOWS_PER_CHUNK = 10000
+
+
+# models for weight files other than the bundled one, keyed by path.
+extra_model_cache = {}
+
+
+def get_model(weights_path=None):
+    '''
+    Returns the TADA model, creating it and loading the weights the first time.
+
+    Parameters
+    ----------
+    weights_path : str, optional
+        Path to a weight file for the TadaModel architecture.
+        Default is None, which uses the bundled tada.14-0.02.hdf5 weights.
+    '''
+    global model_cache  # Use the cached model
+    # thread counts have to be set before Tensorflow runs anything.
+    runtime.configure_threads()
+    if weights_path is not None and str(weights_path) != get_model_path():
+        weights_path = str(weights_path)
+        if weights_path not in extra_model_cache:
+            instrumentation.count('model_cache_misses')
+            with instrumentation.stage('model_load'):
+                model = TadaModel().create_model()
+                model.load_weights(weights_path)
+            extra_model_cache[weights_path] = model
+        else:
+            instrumentation.count('model_cache_hits')
+        return extra_model_cache[weights_path]
+    if model_cache is None:
+        instrumentation.count('model_cache_misses')
+        with instrumentation.stage('model_load'):
+            # Load the model
+            model_cache = TadaModel().create_model()
+            # Load weights
+            model_cache.load_weights(str(get_model_path()))
+    else:
+        instrumentation.count('model_cache_hits')
+    return model_cache
+
+
+def feature_shape():
+    '''
+    Returns the (steps, properties) shape of the features for one window.
+    '''
+    return ((LENGTH - SEQUENCE_WINDOW) // STEPS + 1, PROPERTIES)
+
+
+def get_chunk_size(num_windows, max_windows_per_chunk=None, max_memory=None):
+    '''
+    Works out how many windows to process at once.
+
+    Parameters
+    ----------
+    num_windows : int
+        The total number of windows to predict.
+    max_windows_per_chunk : int, optional
+        Maximum number of windows per chunk.
+        Default is DEFAULT_MAX_WINDOWS_PER_CHUNK.
+    max_memory : int, optional
+        Maximum number of bytes to use for the feature buffer and its tensor copy.
+
+    Returns
+    -------
+    int
+        The number of windows per chunk.
+    '''
+    if max_windows_per_chunk is None:
+        max_windows_per_chunk = DEFAULT_MAX_WINDOWS_PER_CHUNK
+    chunk_size = max_windows_per_chunk
+    if max_memory is not None:
+        steps, properties = feature_shape()
+        # float64 feature buffer plus the tensor made from it.
+        bytes_per_window = 2 * steps * properties * 8
+        chunk_size = min(chunk_size, max_memory // bytes_per_window)
+    if chunk_size < 1:
+        raise ValueError('max_windows_per_chunk and max_memory must allow at least one window per chunk.')
+    return max(1, min(chunk_size, num_windows))
+
+
+def iter_feature_chunks(sequences, chunk_size, feature_store=None, feature_backend=None):
+    '''
+    Generator that yields scaled features for sequences one chunk at a time.
+
+    Parameters
+    ----------
+    sequences : list
+        List of 40 amino acid sequences.
+    chunk_size : int
+        Number of sequences per chunk.
+    feature_store : str or FeatureStore, optional
+        Directory (or FeatureStore) to read stored features from / save them to.
+    feature_backend : str, optional
+        Passed on to create_features(). Default is None (localCIDER).
+
+    Yields
+    ------
+    tuple
+        (start, features) where features is a (chunk, 36, 42) array for
+        sequences[start:start + len(features)]. Without a feature store the
+        same buffer is reused for every chunk, so use it before asking for the next one.
+    '''
+    # a store opened here from a directory is closed again when the generator finishes.
+    opened_store = None
+    if feature_store is not None:
+        if not isinstance(feature_store, FeatureStore):
+            feature_store = opened_store = FeatureStore(feature_store, SEQUENCE_WINDOW, STEPS, LENGTH, PROPERTIES,
+                                                        backend=feature_backend)
+        elif feature_store.backend != resolve_backend(feature_backend):
+            raise ValueError(f'The feature store holds features from the {feature_store.backend} backend, '
+                             f'not {feature_backend}.')
+    else:
+        # one feature buffer is reused for every chunk so peak memory
+        # depends on the chunk size and not on the number of sequences.
+        # the fused kernels write float32, the precision the model runs at.
+        buffer = np.empty((chunk_size,) + feature_shape(), dtype=np.float64 if feature_backend is None else np.float32)
+        instrumentation.peak('feature_array_bytes', buffer.nbytes)
+
+    try:
+        for start in range(0, len(sequences), chunk_size):
+            chunk = sequences[start:start + chunk_size]
+            instrumentation.peak('batch_size', len(chunk))
+
+            # get scaled features
+            if feature_store is not None:
+                # windows are stored one by one, so they are found however earlier calls were split.
+                features = feature_store.get_or_build(chunk, chunk_size=chunk_size)
+            else:
+                features = buffer[:len(chunk)]
+                with instrumentation.stage('create_features'):
+                    create_features(chunk, SEQUENCE_WINDOW, STEPS, LENGTH, PROPERTIES, out=features,
+                                    backend=feature_backend)
+                with instrumentation.stage('scale_features_predict'):
+                    scale_features_predict(features, SEQUENCE_WINDOW, STEPS, LENGTH, inplace=True)
+            yield start, features
+    finally:
+        if opened_store is not None:
+            opened_store.close()
+
+
+def predict_tada(sequences, return_both_values=False, max_windows_per_chunk=None, max_memory=None,
+                 feature_store=None, weights_path=None, feature_backend=None, batch_size=None,
+                 threads=None, workers=None):
     '''
     Parameters
     ----------
@@ -32,34 +190,91 @@ def predict_tada(sequences, return_both_values=False):
         value is returned. Default is False.
         The first value matches the 'TAD' scores that are used in the TADA paper.
 
+    max_windows_per_chunk : int
+        Maximum number of sequences to featurize and predict at once.
+        Default is DEFAULT_MAX_WINDOWS_PER_CHUNK.
+
+    max_memory : int
+        Maximum number of bytes to use for features at once. The chunk size is
+        reduced to fit if needed. Default is None (no memory cap).
+
+    feature_store : str or FeatureStore
+        Directory (or FeatureStore) to keep scaled features in between runs.
+        If the features for these sequences were stored before they are read
+        from disk chunk by chunk instead of being recomputed.
+        Default is None (features are not stored).
+
+    weights_path : str
+        Path to a weight file for the TadaModel architecture.
+        Default is None, which uses the bundled tada.14-0.02.hdf5 weights.
+
+    feature_backend : str
+        Passed on to create_features(). None (default) uses localCIDER for every
+        feature, 'numba', 'numpy' or 'auto' use the fused kernels.
+
+    batch_size : int or str
+        Number of windows per model call, or 'auto' to pick one from a quick
+        calibration run (once per process). Default is None, which uses the
+        TADA_T2_BATCH_SIZE environment variable or 'auto'.
+
+    threads : int
+        Number of Tensorflow intra-op threads. Only takes effect before the
+        model is first loaded. Default is None, which uses
+        TADA_T2_INTRA_OP_THREADS or the cores available to this process.
+
+    workers : int or WorkerPool
+        If set, featurize and score the windows on a pool of pre-forked worker
+        processes that share one copy of the model (see workers.py). An int
+        starts (once per session) a pool with that many workers. Cannot be
+        combined with feature_store, max_windows_per_chunk, max_memory,
+        batch_size or threads: the pool sends batches of WorkerPool.batch_windows
+        windows and each worker scores a batch in one NumPy call on its share of
+        the cores. Default is None (score in this process).
+
     Returns
     -------
     list
         List of TADA scores for each input sequence.
     '''
-    global model_cache  # Use the cached model
-
     if not isinstance(sequences, list):
         raise Exception('Sequences must be input as a list!')
 
-    # Defines the sequence window size and steps (stride length). Change values if needed.
-    SEQUENCE_WINDOW = 5
-    STEPS = 1
-    LENGTH = 40
+    if workers is not None:
+        ignored = {'feature_store': feature_store, 'max_windows_per_chunk': max_windows_per_chunk,
+                   'max_memory': max_memory, 'batch_size': batch_size, 'threads': threads}
+        ignored = [name for name, value in ignored.items() if value is not None]
+        if ignored:
+            raise ValueError(f'{", ".join(ignored)} cannot be combined with workers.')
+        if not isinstance(workers, WorkerPool):
+            workers = get_worker_pool(workers, weights_path=weights_path, feature_backend=feature_backend)
+        return workers.predict(sequences, return_both_values=return_both_values)
 
-    # get scaled features
-    features =create_features(sequences, SEQUENCE_WINDOW, STEPS)
-    features =  scale_features_predict(features)
-    features = convert_to_tensor(features)
+    instrumentation.count('windows', len(sequences))
+    if threads is not None:
+        runtime.configure_threads(intra_op_threads=threads)
+    model = get_model(weights_path)
+
+    chunk_size = get_chunk_size(len(sequences), max_windows_per_chunk, max_memory)
+    batch_size = runtime.resolve_batch_size(batch_size, len(sequences), model, feature_shape())
+    instrumentation.peak('model_batch_size', batch_size)
+    predictions = None
+
+    for start, features in iter_feature_chunks(sequences, chunk_size, feature_store=feature_store,
+                                               feature_backend=feature_backend):
+        with instrumentation.stage('convert_to_tensor'):
+            tensor = convert_to_tensor(features)
+
+        # run predictions
+        with instrumentation.stage('model_predict'):
+            chunk_predictions = model.predict(tensor, batch_size=batch_size, verbose=0)
+        del tensor
+        if predictions is None:
+            predictions = np.empty((len(sequences),) + chunk_predictions.shape[1:], dtype=chunk_predictions.dtype)
+        predictions[start:start + len(features)] = chunk_predictions
+
+    if predictions is None:
+        predictions = np.empty((0, 2), dtype=np.float32)
 
-    # check cached model
-    if model_cache is None:
-        # Load the model
-        model_cache = TadaModel().create_model()
-        # Load weights
-        model_cache.load_weights(str(get_model_path()))
-    # run predictions
-    predictions = model_cache.predict(features, verbose=0)
     # return predictions. 
     if return_both_values:
         return predictions
@@ -0,0 +1,113 @@
+'''
+Code for turning per-window TADA scores into per-residue profiles
+and for calling TAD regions from those profiles.
+'''
+import numpy as np
+
+
+def window_offsets(sequence_length, window_length=40, overlap=39):
+    '''
+    Function to get the start position of every window that
+    sliding_window() makes for a sequence of a given length.
+
+    Parameters
+    ----------
+    sequence_length : int
+        The length of the sequence that was windowed.
+    window_length : int
+        The length of each window.
+    overlap : int
+        The number of residues that overlap between consecutive windows.
+
+    Returns
+    -------
+    np.ndarray
+        Array of window start positions (0-indexed).
+    '''
+    if sequence_length <= window_length:
+        return np.zeros(1, dtype=np.int64)
+    step = window_length - overlap
+    return np.arange(0, sequence_length - window_length + 1, step, dtype=np.int64)
+
+
+def residue_profile(scores, offsets, sequence_length, window_length=40):
+    '''
+    Function to aggregate window scores onto the residues each window covers.
+    The mean track is computed with a difference array (a box convolution of
+    the scores over the window length) and the max track with a single
+    unbuffered maximum reduction, so no per-residue Python loop is needed.
+
+    Parameters
+    ----------
+    scores : array-like
+        The score for each window.
+    offsets : array-like
+        The start position of each window, as returned by window_offsets().
+    sequence_length : int
+        The length of the sequence the windows came from.
+    window_length : int
+        The length of each window.
+
+    Returns
+    -------
+    dict
+        Dict with 'mean' and 'max' keys holding float arrays of length
+        sequence_length. Residues not covered by any window are NaN.
+    '''
+    scores = np.asarray(scores, dtype=np.float64).ravel()
+    offsets = np.asarray(offsets, dtype=np.int64).ravel()
+    if scores.shape != offsets.shape:
+        raise ValueError('scores and offsets must have the same length.')
+    ends = np.minimum(offsets + window_length, sequence_length)
+
+    # mean track: running sum of +score at window start and -score at window end.
+    totals = np.zeros(sequence_length + 1)
+    counts = np.zeros(sequence_length + 1)
+    np.add.at(totals, offsets, scores)
+    np.add.at(totals, ends, -scores)
+    np.add.at(counts, offsets, 1)
+    np.add.at(counts, ends, -1)
+    totals = np.cumsum(totals)[:sequence_length]
+    counts = np.cumsum(counts)[:sequence_length]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_track = np.where(counts > 0, totals / counts, np.nan)
+
+    # max track: scatter every window score onto the residues it covers.
+    max_track = np.full(sequence_length, -np.inf)
+    covered = offsets[:, None] + np.arange(window_length)
+    valid = covered < sequence_length
+    np.maximum.at(max_track, covered[valid], np.broadcast_to(scores[:, None], covered.shape)[valid])
+    max_track[np.isneginf(max_track)] = np.nan
+
+    return {'mean': mean_track, 'max': max_track}
+
+
+def call_regions(profile, threshold=0.5, min_length=1):
+    '''
+    Function to find contiguous stretches of a per-residue profile
+    that are at or above a threshold.
+
+    Parameters
+    ----------
+    profile : array-like
+        A per-residue score track such as the output of residue_profile().
+    threshold : float
+        Minimum score for a residue to be part of a region.
+        Default is 0.5, the threshold used in the TADA paper.
+    min_length : int
+        Minimum number of residues for a region to be reported.
+
+    Returns
+    -------
+    list
+        List of [start, end] pairs (0-indexed, end exclusive).
+    '''
+    profile = np.asarray(profile, dtype=np.float64)
+    above = np.zeros(len(profile) + 2, dtype=np.int8)
+    # NaN compares False so uncovered residues never join a region.
+    above[1:-1] = profile >= threshold
+    edges = np.diff(above)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = (ends - starts) >= min_length
+    return [[int(s), int(e)] for s, e in zip(starts[keep], ends[keep])]
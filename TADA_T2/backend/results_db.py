@@ -0,0 +1,111 @@
+'''
+Code for keeping prediction results in a local SQLite database so that
+only new or changed sequences have to be scored on later runs.
+'''
+import functools
+import hashlib
+import json
+import sqlite3
+
+from TADA_T2.backend.features import get_scaler_path
+from TADA_T2.backend import instrumentation
+
+# SQLite limits the number of parameters in one query.
+_QUERY_BATCH = 500
+
+
+@functools.lru_cache(maxsize=None)
+def file_hash(path):
+    '''
+    Returns the SHA-256 hex digest of a file.
+    '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def sequence_hash(sequence):
+    '''
+    Returns the SHA-256 hex digest of a sequence.
+    '''
+    return hashlib.sha256(sequence.encode()).hexdigest()
+
+
+class ResultsDatabase:
+    '''
+    SQLite database of prediction results keyed by a hash of each
+    sequence and a hash of the parameters used to predict it.
+    '''
+    def __init__(self, path):
+        '''
+        Parameters
+        ----------
+        path : str
+            Path to the database file. Created if it does not exist.
+        '''
+        self.path = str(path)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results ('
+                                'sequence_hash TEXT NOT NULL, '
+                                'params TEXT NOT NULL, '
+                                'result TEXT NOT NULL, '
+                                'PRIMARY KEY (sequence_hash, params))')
+        self.connection.commit()
+
+    @staticmethod
+    def params_key(overlap_length=39, pad='GS', approach='even', threshold=None, top_k=None, weights_path=None,
+                   feature_backend=None):
+        '''
+        Returns a key for a set of prediction parameters. The model weights
+        and the feature scaler are included by content so retraining gives a new key.
+        '''
+        # imported here so that the database can be used without loading Tensorflow.
+        from TADA_T2.backend.predictor import get_model_path
+        from TADA_T2.backend.kernels import resolve_backend
+        params = {'overlap_length': overlap_length, 'pad': pad, 'approach': approach,
+                  'threshold': threshold, 'top_k': top_k, 'feature_backend': resolve_backend(feature_backend),
+                  'weights': file_hash(str(weights_path or get_model_path())),
+                  'scaler': file_hash(get_scaler_path())}
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def get_many(self, sequences, params):
+        '''
+        Returns a dict of sequence -> stored result for every sequence that is in the database.
+        '''
+        hashes = {sequence_hash(sequence): sequence for sequence in sequences}
+        hash_list = list(hashes)
+        found = {}
+        for start in range(0, len(hash_list), _QUERY_BATCH):
+            batch = hash_list[start:start + _QUERY_BATCH]
+            rows = self.connection.execute(
+                'SELECT sequence_hash, result FROM results WHERE params = ? AND sequence_hash IN '
+                f'({",".join("?" * len(batch))})', [params] + batch)
+            for key, result in rows:
+                found[hashes[key]] = json.loads(result)
+        instrumentation.count('results_db_hits', len(found))
+        return found
+
+    def put_many(self, results, params):
+        '''
+        Stores a dict of sequence -> result. Scores are stored as floats.
+        '''
+        rows = [(sequence_hash(sequence), params,
+                 json.dumps([[window, float(score)] for window, score in result]))
+                for sequence, result in results.items()]
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?)', rows)
+
+    def close(self):
+        '''
+        Closes the database.
+        '''
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,246 @@
+'''
+Runtime configuration: how many threads Tensorflow uses in this process and
+how many windows the model scores per batch.
+
+Every setting can be passed to predict() or set with an environment variable:
+
+* TADA_T2_INTRA_OP_THREADS: threads used inside one operation (matmuls, convolutions).
+* TADA_T2_INTER_OP_THREADS: operations run at the same time.
+* TADA_T2_PROCESSES: number of TADA_T2 processes sharing this machine. The
+  available cores are split between them when the thread counts are not set.
+* TADA_T2_BATCH_SIZE: windows per model call, or 'auto' to calibrate.
+
+Tensorflow only accepts thread counts before it runs its first operation, so
+they are applied when the model is first loaded.
+'''
+import os
+import time
+import warnings
+
+import numpy as np
+
+from TADA_T2.backend import instrumentation
+
+# batch sizes tried by calibrate_batch_size().
+BATCH_SIZE_CANDIDATES = (32, 64, 128, 256, 512, 1024, 2048)
+
+# with at most this many windows they are scored in one call without calibrating.
+MIN_CALIBRATION_WINDOWS = 1024
+
+# rough upper bound on the memory used by the model per window in a batch
+# (conv, attention and BiLSTM activations in float32).
+ACTIVATION_BYTES_PER_WINDOW = 64 * 1024
+
+# the thread counts applied to Tensorflow, None until configure_threads() runs.
+thread_config = None
+
+# batch size picked by calibrate_batch_size(), kept for the rest of the process.
+calibrated_batch_size = None
+
+
+def available_cores():
+    '''
+    Returns the number of cores this process may run on. Respects CPU
+    affinity (taskset, cgroup cpusets, Slurm) where the OS reports it.
+    '''
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def available_memory():
+    '''
+    Returns the number of bytes of memory currently available, or None if unknown.
+    '''
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _env_int(name):
+    value = os.environ.get(name)
+    if value is None or value.strip() == '':
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a positive integer, got {value!r}.')
+    if value < 1:
+        raise ValueError(f'{name} must be a positive integer, got {value}.')
+    return value
+
+
+def default_thread_counts(processes=None):
+    '''
+    Works out the Tensorflow thread counts for this process.
+
+    Parameters
+    ----------
+    processes : int, optional
+        Number of TADA_T2 processes sharing the machine. Default is the
+        TADA_T2_PROCESSES environment variable, or 1.
+
+    Returns
+    -------
+    tuple
+        (intra_op_threads, inter_op_threads)
+    '''
+    if processes is None:
+        processes = _env_int('TADA_T2_PROCESSES') or 1
+    intra_op_threads = max(1, available_cores() // processes)
+    # the model is a chain of layers, so a second inter-op thread only helps
+    # overlap small ops and is not worth it on a couple of cores.
+    inter_op_threads = 1 if intra_op_threads <= 2 else 2
+    return intra_op_threads, inter_op_threads
+
+
+def configure_threads(intra_op_threads=None, inter_op_threads=None):
+    '''
+    Function to set the Tensorflow thread counts for this process.
+    Values that are not given come from the environment variables and then
+    from default_thread_counts().
+
+    Has to run before Tensorflow runs its first operation. If Tensorflow was
+    already initialized with other thread counts a warning is given and the
+    existing counts are kept.
+
+    Returns
+    -------
+    tuple
+        The (intra_op_threads, inter_op_threads) in use.
+    '''
+    global thread_config
+    default_intra, default_inter = default_thread_counts()
+    requested = (intra_op_threads or _env_int('TADA_T2_INTRA_OP_THREADS') or default_intra,
+                 inter_op_threads or _env_int('TADA_T2_INTER_OP_THREADS') or default_inter)
+    if thread_config is not None:
+        # only warn when a different count was asked for explicitly.
+        if (intra_op_threads, inter_op_threads) != (None, None) and requested != thread_config:
+            warnings.warn(f'Tensorflow is already using {thread_config[0]} intra-op and {thread_config[1]} '
+                          'inter-op threads. Thread counts can only be set before the model is first loaded.')
+        return thread_config
+
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(requested[0])
+        tf.config.threading.set_inter_op_parallelism_threads(requested[1])
+        thread_config = requested
+    except RuntimeError:
+        # Tensorflow was initialized before TADA_T2 loaded the model.
+        thread_config = (tf.config.threading.get_intra_op_parallelism_threads(),
+                         tf.config.threading.get_inter_op_parallelism_threads())
+        if requested != thread_config:
+            warnings.warn('Tensorflow was initialized before TADA_T2 could set its thread counts, '
+                          'so its own settings are used.')
+    return thread_config
+
+
+def calibrate_batch_size(model, feature_shape, candidates=BATCH_SIZE_CANDIDATES, max_memory=None):
+    '''
+    Function to pick the batch size that scores windows fastest on this machine.
+    Each candidate is timed on random features after one warm-up call.
+
+    Parameters
+    ----------
+    model : keras model
+        The loaded TADA model.
+    feature_shape : tuple
+        (steps, properties) shape of the features for one window.
+    candidates : tuple, optional
+        Batch sizes to try. Default is BATCH_SIZE_CANDIDATES.
+    max_memory : int, optional
+        Bytes the model activations may use. Default is a quarter of the
+        available memory. Candidates that would not fit are skipped.
+
+    Returns
+    -------
+    int
+        The fastest batch size.
+    '''
+    if max_memory is None:
+        memory = available_memory()
+        max_memory = memory // 4 if memory is not None else None
+    if max_memory is not None:
+        fitting = [size for size in candidates if size * ACTIVATION_BYTES_PER_WINDOW <= max_memory]
+        candidates = fitting or [min(candidates)]
+
+    rng = np.random.default_rng(0)
+    features = rng.standard_normal((2 * max(candidates),) + tuple(feature_shape)).astype(np.float32)
+    best_size, best_rate = candidates[0], 0
+    for size in candidates:
+        # the first call for a new batch shape includes tracing, so it is not timed.
+        model.predict(features[:size], batch_size=size, verbose=0)
+        start = time.perf_counter()
+        model.predict(features[:2 * size], batch_size=size, verbose=0)
+        rate = 2 * size / max(time.perf_counter() - start, 1e-9)
+        if rate > best_rate:
+            best_size, best_rate = size, rate
+    return best_size
+
+
+def resolve_batch_size(batch_size, num_windows, model, feature_shape):
+    '''
+    Works out the batch size to use for one predict_tada() call.
+
+    Parameters
+    ----------
+    batch_size : int, str or None
+        A number of windows, 'auto' to calibrate, or None to use the
+        TADA_T2_BATCH_SIZE environment variable (default 'auto').
+    num_windows : int
+        Number of windows about to be scored.
+    model : keras model
+        The loaded TADA model, used for calibration.
+    feature_shape : tuple
+        (steps, properties) shape of the features for one window.
+
+    Returns
+    -------
+    int
+        The batch size.
+    '''
+    global calibrated_batch_size
+    if batch_size is None:
+        batch_size = os.environ.get('TADA_T2_BATCH_SIZE', 'auto').strip() or 'auto'
+        if batch_size != 'auto':
+            batch_size = _env_int('TADA_T2_BATCH_SIZE')
+    if batch_size != 'auto':
+        if not isinstance(batch_size, (int, np.integer)) or batch_size < 1:
+            raise ValueError(f"batch_size must be a positive integer or 'auto', got {batch_size!r}.")
+        return int(batch_size)
+    if num_windows <= MIN_CALIBRATION_WINDOWS:
+        # small jobs are scored in a single call, calibrating would cost more than it saves.
+        return max(1, num_windows)
+    if calibrated_batch_size is None:
+        with instrumentation.stage('calibrate_batch_size'):
+            calibrated_batch_size = calibrate_batch_size(model, feature_shape)
+    return calibrated_batch_size
+
+
+def configure_runtime(intra_op_threads=None, inter_op_threads=None, batch_size=None):
+    '''
+    Function to set the runtime options for this process in one call.
+
+    Parameters
+    ----------
+    intra_op_threads : int, optional
+        Threads used inside one Tensorflow operation.
+    inter_op_threads : int, optional
+        Tensorflow operations run at the same time.
+    batch_size : int or str, optional
+        Windows per model call, or 'auto'. Sets TADA_T2_BATCH_SIZE for this process.
+
+    Returns
+    -------
+    dict
+        The thread counts in use and the batch size setting.
+    '''
+    intra_op_threads, inter_op_threads = configure_threads(intra_op_threads, inter_op_threads)
+    if batch_size is not None:
+        if batch_size != 'auto' and (not isinstance(batch_size, int) or batch_size < 1):
+            raise ValueError(f"batch_size must be a positive integer or 'auto', got {batch_size!r}.")
+        os.environ['TADA_T2_BATCH_SIZE'] = str(batch_size)
+    return {'intra_op_threads': intra_op_threads, 'inter_op_threads': inter_op_threads,
+            'batch_size': os.environ.get('TADA_T2_BATCH_SIZE', 'auto')}
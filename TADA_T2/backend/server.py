@@ -0,0 +1,240 @@
+'''
+Local prediction server that keeps the model loaded between requests.
+
+Usage example::
+
+    tada-t2 serve --port 8765
+    tada-t2 serve --socket /tmp/tada.sock
+
+Each request is windowed in its own thread and the windows are handed to a
+single batching thread. The batching thread waits a few milliseconds for
+windows from other clients and scores everything it collected in one
+predict_tada() call, so many small concurrent requests share model calls.
+'''
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from TADA_T2.backend.predictor import predict_tada, get_model
+from TADA_T2.backend.features import get_scaler_metric
+from TADA_T2.backend.feature_store import FeatureStore
+from TADA_T2.backend.fasta import parse_records, convert_sequences
+from TADA_T2.backend.utils import make_sequences_constant_length, map_sequences_to_prediction, filter_window_scores
+
+
+class Batcher:
+    '''
+    Collects windows from concurrent requests and scores them together.
+    '''
+    def __init__(self, max_batch_windows=4096, max_wait=0.005, feature_store=None):
+        '''
+        Parameters
+        ----------
+        max_batch_windows : int
+            Stop collecting once this many windows are waiting.
+        max_wait : float
+            Seconds to wait for more requests after the first one arrives.
+        feature_store : str, FeatureStore or None
+            Directory (or FeatureStore) to keep scaled features in. Default is None.
+        '''
+        self.max_batch_windows = max_batch_windows
+        self.max_wait = max_wait
+        # one store for the life of the server, so its index stays open and
+        # every batch does not start its own segment file.
+        if feature_store is not None and not isinstance(feature_store, FeatureStore):
+            feature_store = FeatureStore(feature_store)
+        self.feature_store = feature_store
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, windows):
+        '''
+        Queues windows for scoring and returns a Future for their scores.
+        '''
+        future = Future()
+        self.requests.put((windows, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            num_windows = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while num_windows < self.max_batch_windows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                num_windows += len(item[0])
+
+            windows = [window for request_windows, _ in batch for window in request_windows]
+            try:
+                scores = np.asarray(predict_tada(windows, feature_store=self.feature_store))
+            except Exception as error:
+                for _, future in batch:
+                    future.set_exception(error)
+                continue
+            start = 0
+            for request_windows, future in batch:
+                future.set_result(scores[start:start + len(request_windows)])
+                start += len(request_windows)
+
+
+def score_sequences(batcher, sequences, overlap_length=39, pad='GS', approach='even',
+                    safe_mode=True, threshold=None, top_k=None):
+    '''
+    Scores sequences through the batcher and returns results in the same
+    format as TADA.predict() with plain floats for the scores.
+    '''
+    if safe_mode and not all([len(seq) >= 40 for seq in sequences]):
+        raise ValueError('Not all sequences are at least 40 amino acids long. '
+                         'Set safe_mode to false to score them padded.')
+    seq_dict = make_sequences_constant_length(sequences, overlap_length=overlap_length, pad=pad, approach=approach)
+    windows, map_to_predictions = map_sequences_to_prediction(seq_dict)
+    scores = batcher.submit(windows).result()
+    boundaries = [indices[0] for indices in map_to_predictions.values()] + [len(windows)]
+    kept = filter_window_scores(scores, boundaries, threshold=threshold, top_k=top_k)
+    return {seq: [[windows[indices[j]], float(scores[indices[j]])] for j in keep]
+            for (seq, indices), keep in zip(map_to_predictions.items(), kept)}
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    '''
+    Handles GET /health and POST /predict.
+
+    The /predict body is JSON with either 'sequences' (a list of sequences) or
+    'fasta' (the text of a .fasta file) plus any of the options of TADA.predict():
+    overlap_length, pad, approach, safe_mode, threshold and top_k.
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self._send_json(404, {'error': f'Unknown path {self.path}'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            options = {key: request[key] for key in
+                       ['overlap_length', 'pad', 'approach', 'safe_mode', 'threshold', 'top_k'] if key in request}
+            if 'fasta' in request:
+                records = parse_records(request['fasta'])
+                headers = [header for header, _ in records]
+                if len(set(headers)) != len(headers):
+                    raise ValueError('The .fasta file contains duplicate headers.')
+                sequences = convert_sequences([sequence for _, sequence in records])
+                predictions = score_sequences(self.server.batcher, sequences, **options)
+                result = {header: [sequence, predictions[sequence]]
+                          for (header, _), sequence in zip(records, sequences)}
+            else:
+                sequences = request['sequences']
+                if isinstance(sequences, str):
+                    sequences = [sequences]
+                result = score_sequences(self.server.batcher, sequences, **options)
+        except (ValueError, KeyError, TypeError) as error:
+            self._send_json(400, {'error': str(error)})
+            return
+        except Exception as error:
+            self._send_json(500, {'error': str(error)})
+            return
+        self._send_json(200, {'predictions': result})
+
+    def log_message(self, format, *args):
+        # keep the server quiet, client addresses are empty for Unix sockets anyway.
+        pass
+
+
+# Unix sockets are not available on every platform (Windows).
+if hasattr(socket, 'AF_UNIX'):
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        '''
+        Threaded HTTP server listening on a Unix socket.
+        '''
+        daemon_threads = True
+
+
+def make_server(host='127.0.0.1', port=8765, socket_path=None, max_batch_windows=4096,
+                max_wait=0.005, feature_store=None):
+    '''
+    Function to load the model and create (but not start) a prediction server.
+
+    Parameters
+    ----------
+    host : str
+        Address to listen on. Default is '127.0.0.1' (this machine only).
+    port : int
+        Port to listen on. Default is 8765.
+    socket_path : str or None
+        If set, listen on this Unix socket instead of host and port.
+        Only available on platforms with Unix sockets.
+    max_batch_windows : int
+        Maximum number of windows scored in one model call. Default is 4096.
+    max_wait : float
+        Seconds to wait for other clients before scoring a batch. Default is 0.005.
+    feature_store : str, FeatureStore or None
+        Directory (or FeatureStore) to keep scaled features in. Default is None.
+
+    Returns
+    -------
+    server
+        A socketserver server. Call serve_forever() to start it.
+    '''
+    if socket_path is not None and not hasattr(socket, 'AF_UNIX'):
+        raise ValueError('Unix sockets are not available on this platform. Use host and port instead.')
+    # load everything up front so the first request is as fast as the rest.
+    get_model()
+    get_scaler_metric()
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, PredictionHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), PredictionHandler)
+        server.daemon_threads = True
+    server.batcher = Batcher(max_batch_windows=max_batch_windows, max_wait=max_wait,
+                             feature_store=feature_store)
+    return server
+
+
+def serve(host='127.0.0.1', port=8765, socket_path=None, max_batch_windows=4096,
+          max_wait=0.005, feature_store=None):
+    '''
+    Function to run a prediction server until interrupted.
+    Takes the same parameters as make_server().
+    '''
+    server = make_server(host=host, port=port, socket_path=socket_path, max_batch_windows=max_batch_windows,
+                         max_wait=max_wait, feature_store=feature_store)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -1,6 +1,8 @@
 # various utilities
 import random
 
+import numpy as np
+
 def sliding_window(s: str, window_length: int, overlap: int) -> list:
     """
     Generates a list of substrings using a sliding window approach with specified overlap.
@@ -182,3 +184,46 @@ def verbose_warning_message(overlap_length, pad, approach):
         approach_message = 'only at the C terminus'
     warning_message=f'Warning: Not all sequences are 40 amino acids long.\nSequences shorter than 40 amino acids will be padded with a {pad_message} {approach_message}.\nSequences longer than 40 amino acids will be windowed to make sequences 40 amino acids in length with {overlap_length} overlapping amino acids.'
     return warning_message
+
+
+def filter_window_scores(scores, boundaries, threshold=None, top_k=None):
+    '''
+    Function to pick which windows to keep for each record in a batch of
+    predictions. Windows below the threshold are dropped with a single vectorized
+    comparison and the top_k windows of each record are found with np.argpartition,
+    so no record is ever fully sorted.
+
+    Parameters
+    ----------
+    scores : array-like
+        The scores for every window in the batch.
+    boundaries : array-like
+        Index of the first window of each record in scores followed by the
+        total number of windows, so record i spans boundaries[i]:boundaries[i+1].
+    threshold : float or None
+        Minimum score for a window to be kept. Default is None (no threshold).
+    top_k : int or None
+        Maximum number of windows to keep per record. Default is None (no limit).
+
+    Returns
+    -------
+    list
+        A list with one array per record holding the indices (relative to the
+        start of that record) of the kept windows in their original order.
+    '''
+    if top_k is not None and (int(top_k) != top_k or top_k < 1):
+        raise ValueError('top_k must be a positive integer.')
+    scores = np.asarray(scores, dtype=np.float64).ravel()
+    if threshold is None:
+        mask = np.ones(len(scores), dtype=bool)
+    else:
+        mask = scores >= threshold
+    kept = []
+    for start, stop in zip(boundaries[:-1], boundaries[1:]):
+        indices = np.flatnonzero(mask[start:stop])
+        if top_k is not None and len(indices) > top_k:
+            record_scores = scores[start:stop][indices]
+            best = np.argpartition(-record_scores, int(top_k) - 1)[:int(top_k)]
+            indices = np.sort(indices[best])
+        kept.append(indices)
+    return kept
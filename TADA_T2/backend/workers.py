@@ -0,0 +1,200 @@
+'''
+Pool of pre-forked inference workers that share one loaded model.
+
+The parent reads the weights once straight from the .hdf5 file into a NumPy
+model (see numpy_model.py) and forks the workers, which read the weights
+copy-on-write. Starting the pool never initializes Tensorflow, whose thread
+pools and locks are not safe to fork, and the workers only use NumPy. Adding
+workers adds almost no startup time or memory for the model.
+
+Start the pool before running Tensorflow predictions in the same process, as
+forking after Tensorflow has started its threads can hang the workers.
+
+Usage example::
+
+    with WorkerPool(workers=8) as pool:
+        scores = pool.predict(windows)
+
+Windows are split into batches on a shared work queue. Each worker featurizes,
+scales and scores whole batches, and the parent puts the results back in order.
+'''
+import multiprocessing
+import queue
+import threading
+
+import numpy as np
+
+from TADA_T2.backend.features import create_features, scale_features_predict, get_scaler_metric
+from TADA_T2.backend.numpy_model import NumpyTadaModel
+from TADA_T2.backend import instrumentation
+from TADA_T2.backend import runtime
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+# seconds between checks that the workers are still alive while waiting for results.
+_POLL_INTERVAL = 1.0
+
+
+def _worker_loop(model, tasks, results, feature_backend, threads):
+    '''
+    Runs in each forked worker until it gets None from the task queue.
+    '''
+    limits = threadpool_limits(threads) if threadpool_limits is not None else None
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            job, batch_index, windows = task
+            try:
+                features = create_features(windows, backend=feature_backend)
+                scale_features_predict(features, inplace=True)
+                results.put((job, batch_index, model.predict(features, batch_size=len(windows)), None))
+            except Exception as error:
+                results.put((job, batch_index, None, f'{type(error).__name__}: {error}'))
+    finally:
+        if limits is not None:
+            limits.unregister()
+
+
+class WorkerPool:
+    '''
+    Pre-forked inference workers sharing one copy of the model weights.
+    '''
+    def __init__(self, workers=None, weights_path=None, batch_windows=1024, feature_backend=None):
+        '''
+        Parameters
+        ----------
+        workers : int, optional
+            Number of worker processes. Default is the number of cores
+            available to this process.
+        weights_path : str, optional
+            Path to a weight file for the TadaModel architecture.
+            Default is None, which uses the bundled weights.
+        batch_windows : int, optional
+            Windows per work item. Default is 1024.
+        feature_backend : str, optional
+            Passed on to create_features() in the workers. Default is None (localCIDER).
+        '''
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise ValueError('WorkerPool needs the fork start method, which this platform does not have.')
+        if batch_windows < 1:
+            raise ValueError('batch_windows must be a positive integer.')
+        self.workers = workers or runtime.available_cores()
+        self.batch_windows = batch_windows
+        self.weights_path = weights_path
+        self.feature_backend = feature_backend
+        # everything the workers need is loaded before forking so they share it.
+        with instrumentation.stage('worker_pool_start'):
+            self.model = NumpyTadaModel.from_hdf5(weights_path)
+            get_scaler_metric()
+            # builds the fused kernel tables (and compiles Numba) once for every worker.
+            create_features(['G' * 40], backend=feature_backend)
+
+            context = multiprocessing.get_context('fork')
+            self.tasks = context.Queue()
+            self.results = context.Queue()
+            threads = max(1, runtime.available_cores() // self.workers)
+            self.processes = [context.Process(target=_worker_loop, daemon=True,
+                                              args=(self.model, self.tasks, self.results, feature_backend, threads))
+                              for _ in range(self.workers)]
+            for process in self.processes:
+                process.start()
+        self.lock = threading.Lock()
+        self.job = 0
+        self.closed = False
+
+    def predict(self, sequences, return_both_values=False):
+        '''
+        Scores 40 amino acid windows on the workers.
+
+        Parameters
+        ----------
+        sequences : list
+            List of sequences to predict TADA scores for.
+        return_both_values : bool
+            Whether to return both model outputs, as for predict_tada().
+
+        Returns
+        -------
+        list or np.ndarray
+            Same as predict_tada().
+        '''
+        if self.closed:
+            raise ValueError('The worker pool is closed.')
+        # one job at a time so results from different callers never mix.
+        with self.lock:
+            self.job += 1
+            batches = [sequences[start:start + self.batch_windows]
+                       for start in range(0, len(sequences), self.batch_windows)]
+            for batch_index, batch in enumerate(batches):
+                self.tasks.put((self.job, batch_index, batch))
+            instrumentation.count('windows', len(sequences))
+            instrumentation.count('worker_batches', len(batches))
+
+            predictions = np.empty((len(sequences), 2), dtype=np.float32)
+            received = 0
+            error = None
+            while received < len(batches):
+                try:
+                    job, batch_index, batch_predictions, batch_error = self.results.get(timeout=_POLL_INTERVAL)
+                except queue.Empty:
+                    if not all(process.is_alive() for process in self.processes):
+                        self.close()
+                        raise RuntimeError('A TADA_T2 worker process died. The worker pool was closed.')
+                    continue
+                if job != self.job:
+                    # left over from an earlier job that stopped on an error.
+                    continue
+                received += 1
+                if batch_error is not None:
+                    error = error or batch_error
+                    continue
+                start = batch_index * self.batch_windows
+                predictions[start:start + len(batch_predictions)] = batch_predictions
+            if error is not None:
+                raise RuntimeError(f'A TADA_T2 worker failed: {error}')
+
+        if return_both_values:
+            return predictions
+        return [i[0] for i in predictions]
+
+    def close(self):
+        '''
+        Stops the workers.
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        for process in self.processes:
+            if process.is_alive():
+                self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+# pools started by get_worker_pool(), kept for the rest of the session.
+pool_cache = {}
+
+
+def get_worker_pool(workers=None, weights_path=None, feature_backend=None):
+    '''
+    Returns a running WorkerPool for these settings, starting it the first time.
+    '''
+    key = (workers or runtime.available_cores(), str(weights_path) if weights_path else None, feature_backend)
+    if key not in pool_cache or pool_cache[key].closed:
+        instrumentation.count('worker_pool_cache_misses')
+        pool_cache[key] = WorkerPool(workers=key[0], weights_path=weights_path, feature_backend=feature_backend)
+    return pool_cache[key]
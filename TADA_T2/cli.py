@@ -0,0 +1,252 @@
+'''
+Command-line interface for TADA_T2.
+
+Usage example::
+
+    tada-t2 predict proteome.fasta -o scores.tsv --shard 0/4 --chunk-size 500
+
+Records are read from the (optionally gzip/bgzip compressed) .fasta file through an
+index, so each shard seeks straight to its own fixed-size chunks of records.
+Every finished chunk is appended to the output file and recorded in a checkpoint
+file, so running the same command again after an interruption picks up after the
+last finished chunk.
+'''
+import argparse
+import json
+import os
+import socket
+import sys
+
+from TADA_T2.backend.fasta import IndexedFasta
+
+
+def parse_shard(shard):
+    '''
+    Function to parse a shard string of the form 'i/N'.
+
+    Parameters
+    ----------
+    shard : str
+        The shard as 'i/N' where 0 <= i < N.
+
+    Returns
+    -------
+    tuple
+        (i, N) as ints.
+    '''
+    try:
+        index, total = (int(value) for value in shard.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Shard must be given as i/N, got {shard}.')
+    if total < 1 or not 0 <= index < total:
+        raise argparse.ArgumentTypeError(f'Shard index must satisfy 0 <= i < N, got {shard}.')
+    return index, total
+
+
+def parse_batch_size(value):
+    '''
+    Parses a --batch-size value, a positive integer or 'auto'.
+    '''
+    if value == 'auto':
+        return value
+    try:
+        batch_size = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Batch size must be a positive integer or 'auto', got {value!r}.")
+    if batch_size < 1:
+        raise argparse.ArgumentTypeError(f"Batch size must be a positive integer or 'auto', got {value!r}.")
+    return batch_size
+
+
+class Checkpoint:
+    '''
+    Tracks which chunks have been written to an output file.
+    The checkpoint is a JSON-lines file. The first line holds the run
+    parameters and every following line holds a finished chunk index and
+    the size of the output file right after that chunk was written.
+    '''
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+        self.completed = set()
+        self.offset = None
+
+    def load(self):
+        '''
+        Reads an existing checkpoint. Returns True if one was found.
+        '''
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as fh:
+            lines = [json.loads(line) for line in fh if line.strip()]
+        if not lines:
+            return False
+        if lines[0].get('params') != self.params:
+            raise ValueError(f'Checkpoint {self.path} was written with different parameters. '
+                             'Delete it or use a different output file.')
+        for entry in lines[1:]:
+            self.completed.add(entry['chunk'])
+            self.offset = entry['offset']
+        return True
+
+    def start(self):
+        '''
+        Starts a new checkpoint file.
+        '''
+        with open(self.path, 'w') as fh:
+            fh.write(json.dumps({'params': self.params}) + '\n')
+
+    def record(self, chunk_index, offset):
+        '''
+        Records a finished chunk.
+        '''
+        with open(self.path, 'a') as fh:
+            fh.write(json.dumps({'chunk': chunk_index, 'offset': offset}) + '\n')
+            fh.flush()
+            os.fsync(fh.fileno())
+        self.completed.add(chunk_index)
+        self.offset = offset
+
+
+def run_predict(args):
+    '''
+    Runs the predict subcommand.
+    '''
+    # import here so that --help does not have to load Tensorflow.
+    from TADA_T2.TADA import predict
+    from TADA_T2.backend.kernels import resolve_backend
+
+    # the index lets each shard seek straight to its own chunks.
+    fasta = IndexedFasta(args.input)
+    shard_index, shard_total = args.shard
+    # size and mtime of the input make a rerun on a changed file fail instead of mixing records.
+    params = {'input': os.path.abspath(args.input), 'input_size': fasta.fingerprint['size'],
+              'input_mtime_ns': fasta.fingerprint['mtime_ns'], 'shard': [shard_index, shard_total],
+              'chunk_size': args.chunk_size, 'overlap_length': args.overlap_length,
+              'pad': args.pad, 'approach': args.approach, 'safe_mode': not args.unsafe,
+              'threshold': args.threshold, 'top_k': args.top_k,
+              'feature_backend': resolve_backend(args.feature_backend)}
+    checkpoint = Checkpoint(args.checkpoint or args.output + '.ckpt', params)
+
+    if os.path.exists(args.output) and checkpoint.load():
+        # drop anything written after the last recorded chunk.
+        out = open(args.output, 'r+')
+        offset = checkpoint.offset or 0
+        out.truncate(offset)
+        out.seek(offset)
+        if offset == 0:
+            out.write('name\twindow\tscore\n')
+        if args.verbose:
+            print(f'Resuming with {len(checkpoint.completed)} finished chunks.', file=sys.stderr)
+    else:
+        checkpoint.start()
+        out = open(args.output, 'w')
+        out.write('name\twindow\tscore\n')
+
+    num_chunks = -(-len(fasta) // args.chunk_size)
+    with out:
+        for chunk_index in range(shard_index, num_chunks, shard_total):
+            if chunk_index in checkpoint.completed:
+                continue
+            records = fasta.read(chunk_index * args.chunk_size, (chunk_index + 1) * args.chunk_size)
+            sequences = [sequence for _, sequence in records]
+            predictions = predict(sequences, overlap_length=args.overlap_length, pad=args.pad,
+                                  approach=args.approach, verbose=False, safe_mode=not args.unsafe,
+                                  threshold=args.threshold, top_k=args.top_k,
+                                  feature_store=args.feature_store, results_db=args.results_db,
+                                  feature_backend=args.feature_backend, batch_size=args.batch_size,
+                                  threads=args.threads, workers=args.workers)
+            for name, sequence in records:
+                for window, score in predictions[sequence]:
+                    out.write(f'{name}\t{window}\t{float(score):.6g}\n')
+            out.flush()
+            os.fsync(out.fileno())
+            checkpoint.record(chunk_index, out.tell())
+            if args.verbose:
+                print(f'Finished chunk {chunk_index}.', file=sys.stderr)
+
+
+def run_serve(args):
+    '''
+    Runs the serve subcommand.
+    '''
+    # import here so that --help does not have to load Tensorflow.
+    from TADA_T2.backend.server import serve
+
+    where = args.socket or f'http://{args.host}:{args.port}'
+    print(f'Serving TADA_T2 predictions on {where}', file=sys.stderr)
+    serve(host=args.host, port=args.port, socket_path=args.socket, max_batch_windows=args.max_batch_windows,
+          max_wait=args.max_wait_ms / 1000, feature_store=args.feature_store)
+
+
+def build_parser():
+    '''
+    Builds the argument parser for the tada-t2 command.
+    '''
+    parser = argparse.ArgumentParser(prog='tada-t2',
+                                     description='Predict transcriptional activation domains with TADA_T2.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    predict_parser = subparsers.add_parser('predict', help='Predict TAD scores for every record in a .fasta file.')
+    predict_parser.add_argument('input', help='Path to the input .fasta file (can be gzip/bgzip compressed).')
+    predict_parser.add_argument('-o', '--output', required=True, help='Path to the output .tsv file.')
+    predict_parser.add_argument('--checkpoint', default=None,
+                                help='Path to the checkpoint file. Default is the output path with .ckpt appended.')
+    predict_parser.add_argument('--chunk-size', type=int, default=1000,
+                                help='Number of records per chunk. Default is 1000.')
+    predict_parser.add_argument('--shard', type=parse_shard, default=(0, 1),
+                                help='Only process chunks where chunk_index %% N == i, given as i/N. Default is 0/1.')
+    predict_parser.add_argument('--overlap-length', type=int, default=39,
+                                help='Overlap between windows. Default is 39.')
+    predict_parser.add_argument('--pad', choices=['GS', 'random'], default='GS', help='How to pad short sequences.')
+    predict_parser.add_argument('--approach', choices=['even', 'N', 'C'], default='even',
+                                help='Where to pad short sequences.')
+    predict_parser.add_argument('--unsafe', action='store_true', help='Allow sequences under 40 amino acids (padded).')
+    predict_parser.add_argument('--threshold', type=float, default=None,
+                                help='Only write windows scoring at or above this value.')
+    predict_parser.add_argument('--top-k', type=int, default=None, help='Only write the top K windows per record.')
+    predict_parser.add_argument('--feature-store', default=None,
+                                help='Directory to keep scaled features in so reruns skip featurization.')
+    predict_parser.add_argument('--results-db', default=None,
+                                help='SQLite database of earlier results. Only new or changed sequences are scored.')
+    predict_parser.add_argument('--feature-backend', choices=['auto', 'numba', 'numpy'], default=None,
+                                help='Calculate features with the fused kernels instead of localCIDER.')
+    predict_parser.add_argument('--batch-size', type=parse_batch_size, default=None,
+                                help="Windows per model call, or 'auto' to calibrate. "
+                                     'Default is $TADA_T2_BATCH_SIZE or auto.')
+    predict_parser.add_argument('--threads', type=int, default=None,
+                                help='Tensorflow threads for this process. Default is the cores available to it.')
+    predict_parser.add_argument('--workers', type=int, default=None,
+                                help='Score on this many pre-forked worker processes sharing one loaded model.')
+    predict_parser.add_argument('-v', '--verbose', action='store_true', help='Report progress on stderr.')
+    predict_parser.set_defaults(func=run_predict)
+
+    serve_parser = subparsers.add_parser('serve', help='Run a local prediction server that keeps the model loaded.')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='Address to listen on. Default is 127.0.0.1.')
+    serve_parser.add_argument('--port', type=int, default=8765, help='Port to listen on. Default is 8765.')
+    serve_parser.add_argument('--socket', default=None, help='Listen on this Unix socket instead of host and port.')
+    serve_parser.add_argument('--max-batch-windows', type=int, default=4096,
+                              help='Maximum number of windows scored in one model call. Default is 4096.')
+    serve_parser.add_argument('--max-wait-ms', type=float, default=5,
+                              help='Milliseconds to wait for other clients before scoring a batch. Default is 5.')
+    serve_parser.add_argument('--feature-store', default=None,
+                              help='Directory to keep scaled features in between requests.')
+    serve_parser.set_defaults(func=run_serve)
+    return parser
+
+
+def main(argv=None):
+    '''
+    Entry point for the tada-t2 command.
+    '''
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'chunk_size', 1) < 1:
+        parser.error('--chunk-size must be a positive integer.')
+    if getattr(args, 'socket', None) is not None and not hasattr(socket, 'AF_UNIX'):
+        parser.error('--socket needs Unix sockets, which this platform does not have. Use --host and --port.')
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,3 +13,12 @@ import TADA_T2
 def test_TADA_T2_imported():
     """Sample test, will always pass so long as import statement worked."""
     assert "TADA_T2" in sys.modules
+
+
+def test_lazy_attributes():
+    """Only the public functions and the TADA module are loaded lazily."""
+    assert not hasattr(TADA_T2, "pytest_plugins")
+    with pytest.raises(AttributeError):
+        TADA_T2.not_a_function
+    assert TADA_T2.TADA.predict is TADA_T2.predict
+    assert TADA_T2.__all__ == TADA_T2.TADA.__all__
@@ -0,0 +1,69 @@
+'''
+Tests for the tada-t2 command-line interface helpers.
+'''
+import argparse
+
+import pytest
+
+from TADA_T2.cli import parse_shard, parse_batch_size, Checkpoint, main
+
+
+def test_parse_shard():
+    '''
+    Shards should parse as (i, N) and reject out of range values.
+    '''
+    assert parse_shard('2/4') == (2, 4)
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_shard('4/4')
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_shard('a/b')
+
+
+def test_parse_batch_size():
+    '''
+    Batch sizes should be positive integers or 'auto'.
+    '''
+    assert parse_batch_size('auto') == 'auto'
+    assert parse_batch_size('256') == 256
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_batch_size('0')
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_batch_size('big')
+
+
+def test_checkpoint_round_trip(tmp_path):
+    '''
+    A checkpoint should remember finished chunks and refuse different parameters.
+    '''
+    path = str(tmp_path / 'out.ckpt')
+    checkpoint = Checkpoint(path, {'chunk_size': 10})
+    checkpoint.start()
+    checkpoint.record(0, 100)
+    checkpoint.record(2, 250)
+    resumed = Checkpoint(path, {'chunk_size': 10})
+    assert resumed.load()
+    assert resumed.completed == {0, 2}
+    assert resumed.offset == 250
+    with pytest.raises(ValueError):
+        Checkpoint(path, {'chunk_size': 5}).load()
+
+
+def test_predict_refuses_changed_input(tmp_path, monkeypatch):
+    '''
+    Rerunning on an input file that changed since the checkpoint was written
+    should fail instead of resuming.
+    '''
+    from TADA_T2 import TADA
+
+    def fake_predict(sequences, **kwargs):
+        return {sequence: [[sequence[:40], 0.5]] for sequence in sequences}
+
+    monkeypatch.setattr(TADA, 'predict', fake_predict)
+    fasta = tmp_path / 'in.fasta'
+    output = str(tmp_path / 'out.tsv')
+    fasta.write_text('>a\n' + 'A' * 40 + '\n>b\n' + 'G' * 40 + '\n')
+    main(['predict', str(fasta), '-o', output, '--chunk-size', '1'])
+    main(['predict', str(fasta), '-o', output, '--chunk-size', '1'])
+    fasta.write_text('>c\n' + 'S' * 45 + '\n')
+    with pytest.raises(ValueError):
+        main(['predict', str(fasta), '-o', output, '--chunk-size', '1'])
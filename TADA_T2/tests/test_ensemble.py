@@ -0,0 +1,28 @@
+'''
+Tests for scoring with several model weight files.
+'''
+import numpy as np
+
+from TADA_T2.TADA import predict, predict_ensemble, register_weights
+from TADA_T2.backend.ensemble import unregister_weights
+from TADA_T2.backend.predictor import get_model_path
+
+SEQUENCES = ['QFNENSNIMQQQPLQGSFNPLLEYDFANHGGQWLSDYIDL',
+             'EFSPENSSSSSWSSQESFLWEESFLHQSFDQSFLLSSPTDEFSPENSSSSSWSSQE']
+
+
+def test_predict_ensemble_of_identical_models_matches_predict():
+    '''
+    Two copies of the bundled weights should agree with predict() and with each other.
+    '''
+    register_weights('copy', get_model_path())
+    try:
+        results = predict_ensemble(SEQUENCES, model_threads=2, verbose=False)
+    finally:
+        unregister_weights('copy')
+    expected = predict(SEQUENCES, verbose=False)
+    for seq in SEQUENCES:
+        assert set(results[seq]['scores']) == {'tada.14-0.02', 'copy'}
+        assert results[seq]['windows'] == [window for window, _ in expected[seq]]
+        assert np.allclose(results[seq]['mean'], [score for _, score in expected[seq]], atol=1e-6)
+        assert np.allclose(results[seq]['std'], 0, atol=1e-6)
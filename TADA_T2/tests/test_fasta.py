@@ -0,0 +1,69 @@
+'''
+Tests for reading plain and compressed .fasta files.
+'''
+import gzip
+import warnings
+
+import pytest
+
+from TADA_T2.backend.fasta import convert_sequences, IndexedFasta, read_fasta
+
+RECORDS = [(f'record_{i} description', 'ACDEFGHIKL' * (i % 5 + 1) + 'MNPQ') for i in range(200)]
+
+
+def write_fasta(path, compress=None):
+    '''
+    Writes RECORDS as a plain, gzip or bgzip-like (many small members) file.
+    '''
+    text = ''.join(f'>{header}\n{sequence[:30]}\n{sequence[30:]}\n' for header, sequence in RECORDS).encode()
+    with open(path, 'wb') as fh:
+        if compress is None:
+            fh.write(text)
+        elif compress == 'gzip':
+            fh.write(gzip.compress(text))
+        else:
+            for start in range(0, len(text), 1000):
+                fh.write(gzip.compress(text[start:start + 1000]))
+    return str(path)
+
+
+def test_convert_sequences():
+    '''
+    Non-standard residues should be converted or dropped and invalid ones rejected.
+    '''
+    sequences = ['ACDXBZ', 'mku*-', '', 'GGG']
+    assert convert_sequences(sequences) == ['ACDGNQ', 'MKC', '', 'GGG']
+    with pytest.raises(ValueError):
+        convert_sequences(['AC1D'])
+
+
+@pytest.mark.parametrize('compress', [None, 'gzip', 'bgzip'])
+def test_indexed_fasta_random_access(tmp_path, compress):
+    '''
+    Records read through the index should match the file, and the index should be reused.
+    '''
+    path = write_fasta(tmp_path / 'test.fasta', compress)
+    if compress == 'gzip':
+        # a single gzip member cannot be seeked into.
+        with pytest.warns(UserWarning, match='bgzip'):
+            fasta = IndexedFasta(path)
+    else:
+        fasta = IndexedFasta(path)
+    assert len(fasta) == len(RECORDS)
+    assert fasta[0] == RECORDS[0]
+    assert fasta[-1] == RECORDS[-1]
+    assert fasta.read(37, 120) == RECORDS[37:120]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        reopened = IndexedFasta(path)
+    assert reopened.starts == fasta.starts
+    start, stop = reopened.shard_range(1, 3)
+    assert reopened.read(start, stop) == RECORDS[start:stop]
+
+
+def test_read_fasta(tmp_path):
+    '''
+    read_fasta should read compressed files into a header -> sequence dict.
+    '''
+    path = write_fasta(tmp_path / 'test.fasta.gz', 'gzip')
+    assert read_fasta(path) == dict(RECORDS)
@@ -0,0 +1,100 @@
+'''
+Tests for feature creation and scaling.
+'''
+import numpy as np
+
+from TADA_T2.backend.features import create_features, scale_features_predict, get_scaler_metric
+from TADA_T2.backend.predictor import get_chunk_size, feature_shape
+
+SEQUENCES = ['QFNENSNIMQQQPLQGSFNPLLEYDFANHGGQWLSDYIDL', 'EFSPENSSSSSWSSQESFLWEESFLHQSFDQSFLLSSPTD']
+
+
+def test_create_features_into_buffer():
+    '''
+    Writing into a reused buffer should give the same features as a fresh array.
+    '''
+    expected = create_features(SEQUENCES)
+    buffer = np.full((2,) + feature_shape(), np.nan)
+    create_features(SEQUENCES, out=buffer)
+    assert expected.shape == (2, 36, 42)
+    assert np.array_equal(expected, buffer)
+
+
+def test_scale_features_predict_matches_per_column_scaling():
+    '''
+    Vectorized scaling should match scaling each column on its own.
+    '''
+    features = create_features(SEQUENCES)
+    scaler_metric = get_scaler_metric()
+    expected = features.copy()
+    for i in range(features.shape[2]):
+        expected[:, :, i] = ((features[:, :, i] - scaler_metric[i, 0]) / scaler_metric[i, 2]
+                             - scaler_metric[i, 5]) / scaler_metric[i, 9]
+    scaled = scale_features_predict(features)
+    assert np.array_equal(scaled, expected)
+    assert not np.array_equal(features, expected)
+    scale_features_predict(features, inplace=True)
+    assert np.array_equal(features, expected)
+
+
+def test_get_chunk_size():
+    '''
+    Chunk size should respect both the window and the memory cap.
+    '''
+    assert get_chunk_size(50, max_windows_per_chunk=20) == 20
+    assert get_chunk_size(5, max_windows_per_chunk=20) == 5
+    bytes_per_window = 2 * 36 * 42 * 8
+    assert get_chunk_size(1000, max_windows_per_chunk=500, max_memory=10 * bytes_per_window) == 10
+
+
+def test_feature_store_round_trip(tmp_path):
+    '''
+    Stored features should match freshly scaled features and be found again.
+    '''
+    from TADA_T2.backend.feature_store import FeatureStore
+
+    store = FeatureStore(str(tmp_path))
+    assert store.get(SEQUENCES) is None
+    built = store.get_or_build(SEQUENCES, chunk_size=1)
+    expected = scale_features_predict(create_features(SEQUENCES))
+    assert np.array_equal(built, expected)
+    assert np.array_equal(FeatureStore(str(tmp_path)).get(SEQUENCES), expected)
+    assert np.array_equal(store.get(SEQUENCES[::-1]), expected[::-1])
+    assert store.key != FeatureStore(str(tmp_path), SEQUENCE_WINDOW=3).key
+    assert store.key != FeatureStore(str(tmp_path), backend='numpy').key
+
+
+def test_feature_store_reuses_windows_across_calls(tmp_path):
+    '''
+    Windows stored by one call should be reused by calls that split
+    the windows differently, and only new windows should be featurized.
+    '''
+    from TADA_T2.backend.feature_store import FeatureStore
+    from TADA_T2.backend.instrumentation import instrument
+
+    store = FeatureStore(str(tmp_path))
+    store.get_or_build(SEQUENCES[:1])
+    windows = SEQUENCES + ['MKRHDECWYTVILAFPGSNQMKRHDECWYTVILAFPGSNQ']
+    with instrument() as stats:
+        features = store.get_or_build(windows)
+    counters = stats.as_dict()['counters']
+    assert counters['feature_store_hits'] == 1
+    assert counters['feature_store_misses'] == 2
+    assert np.array_equal(features, scale_features_predict(create_features(windows)))
+
+
+def test_filtered_rerun_reads_stored_features(tmp_path):
+    '''
+    A filtered rerun should read every window from the features
+    stored by an unfiltered run instead of featurizing them again.
+    '''
+    from TADA_T2.TADA import predict
+    from TADA_T2.backend.instrumentation import instrument
+
+    sequences = [SEQUENCES[0] + SEQUENCES[1], SEQUENCES[1]]
+    predict(sequences, feature_store=str(tmp_path))
+    with instrument() as stats:
+        predict(sequences, threshold=0.5, feature_store=str(tmp_path))
+    counters = stats.as_dict()['counters']
+    assert counters['feature_store_misses'] == 0
+    assert counters['feature_store_hits'] > 0
@@ -0,0 +1,39 @@
+'''
+Tests for the instrumentation hooks.
+'''
+import json
+
+from TADA_T2.backend import instrumentation
+
+
+def test_hooks_do_nothing_when_disabled():
+    '''
+    Hooks outside an instrument() block should not record anything.
+    '''
+    with instrumentation.stage('unused'):
+        pass
+    instrumentation.count('unused')
+    assert instrumentation._active is None
+
+
+def test_instrument_records_and_exports():
+    '''
+    Stages, counters and peaks should be recorded and exported.
+    '''
+    with instrumentation.instrument() as stats:
+        for _ in range(3):
+            with instrumentation.stage('create_features'):
+                pass
+        instrumentation.count('windows', 10)
+        instrumentation.count('windows', 5)
+        instrumentation.peak('batch_size', 8)
+        instrumentation.peak('batch_size', 4)
+    assert instrumentation._active is None
+    data = stats.as_dict()
+    assert data['timings']['create_features']['calls'] == 3
+    assert data['counters']['windows'] == 15
+    assert data['peaks']['batch_size'] == 8
+    assert json.loads(stats.to_json()) == data
+    text = stats.to_prometheus()
+    assert 'tada_t2_stage_calls_total{stage="create_features"} 3' in text
+    assert 'tada_t2_windows_total 15' in text
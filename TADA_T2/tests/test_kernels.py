@@ -0,0 +1,40 @@
+'''
+Tests for the fused feature kernels.
+'''
+import numpy as np
+import pytest
+
+from TADA_T2.backend.features import create_features
+from TADA_T2.backend.kernels import create_features_fused, available_backends
+
+SEQUENCES = ['QFNENSNIMQQQPLQGSFNPLLEYDFANHGGQWLSDYIDL', 'EFSPENSSSSSWSSQESFLWEESFLHQSFDQSFLLSSPTD',
+             'MKRHDECWYTVILAFPGSNQMKRHDECWYTVILAFPGSNQ', 'GSGSDEDEDEDEDEGSGS']
+
+
+@pytest.mark.parametrize('backend', available_backends())
+def test_create_features_fused_matches_create_features(backend):
+    '''
+    The fused kernels should give the same features as create_features(),
+    including for sequences shorter than 40 amino acids.
+    '''
+    expected = create_features(SEQUENCES)
+    fused = create_features_fused(SEQUENCES, backend=backend)
+    assert fused.dtype == np.float32
+    assert fused.shape == expected.shape
+    assert np.allclose(fused, expected, rtol=1e-5, atol=1e-5)
+
+
+def test_create_features_fused_into_buffer():
+    '''
+    Writing into a reused buffer should match a fresh array and
+    create_features(backend=...) should use the fused kernels.
+    '''
+    expected = create_features_fused(SEQUENCES)
+    buffer = np.full(expected.shape, np.nan, dtype=np.float32)
+    create_features(SEQUENCES, out=buffer, backend='auto')
+    assert np.array_equal(expected, buffer)
+
+
+def test_create_features_fused_rejects_invalid_residues():
+    with pytest.raises(ValueError):
+        create_features_fused(['QFNENSNIMQQQPLQGSFNPLLEYDFANHGGQWLSDYIDX'])
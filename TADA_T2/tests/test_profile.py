@@ -0,0 +1,43 @@
+'''
+Tests for the per-residue profile and region calling code.
+'''
+import numpy as np
+
+from TADA_T2.backend.profile import window_offsets, residue_profile, call_regions
+
+
+def test_window_offsets_match_sliding_window():
+    '''
+    Offsets should line up with the windows made by sliding_window().
+    '''
+    assert list(window_offsets(45)) == [0, 1, 2, 3, 4, 5]
+    assert list(window_offsets(100, overlap=20)) == [0, 20, 40, 60]
+    assert list(window_offsets(30)) == [0]
+
+
+def test_residue_profile_matches_brute_force():
+    '''
+    Mean and max tracks should match an explicit loop over covering windows.
+    '''
+    rng = np.random.default_rng(0)
+    length = 97
+    offsets = window_offsets(length, overlap=30)
+    scores = rng.random(len(offsets))
+    profile = residue_profile(scores, offsets, length)
+    for residue in range(length):
+        covering = [s for s, o in zip(scores, offsets) if o <= residue < o + 40]
+        if covering:
+            assert np.isclose(profile['mean'][residue], np.mean(covering))
+            assert np.isclose(profile['max'][residue], np.max(covering))
+        else:
+            assert np.isnan(profile['mean'][residue])
+            assert np.isnan(profile['max'][residue])
+
+
+def test_call_regions():
+    '''
+    Regions should be contiguous runs at or above the threshold.
+    '''
+    profile = np.array([0.1, 0.6, 0.7, 0.2, 0.5, 0.5, 0.5, np.nan, 0.9])
+    assert call_regions(profile, threshold=0.5) == [[1, 3], [4, 7], [8, 9]]
+    assert call_regions(profile, threshold=0.5, min_length=3) == [[4, 7]]
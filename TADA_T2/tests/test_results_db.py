@@ -0,0 +1,58 @@
+'''
+Tests for the results database used for incremental predictions.
+'''
+from TADA_T2.backend.results_db import ResultsDatabase
+
+
+def test_results_database_round_trip(tmp_path):
+    '''
+    Stored results should come back only for the same sequence and parameters.
+    '''
+    path = str(tmp_path / 'results.sqlite')
+    sequence = 'QFNENSNIMQQQPLQGSFNPLLEYDFANHGGQWLSDYIDL'
+    with ResultsDatabase(path) as database:
+        assert database.get_many([sequence], 'params-a') == {}
+        database.put_many({sequence: [[sequence, 0.637078643]]}, 'params-a')
+    with ResultsDatabase(path) as database:
+        assert database.get_many([sequence, 'OTHER'], 'params-a') == {sequence: [[sequence, 0.637078643]]}
+        assert database.get_many([sequence], 'params-b') == {}
+
+
+def test_params_key_changes_with_parameters():
+    '''
+    Different prediction parameters should give different keys.
+    '''
+    key = ResultsDatabase.params_key()
+    assert key == ResultsDatabase.params_key()
+    assert key != ResultsDatabase.params_key(overlap_length=20)
+    assert key != ResultsDatabase.params_key(threshold=0.5)
+    assert key != ResultsDatabase.params_key(feature_backend='numpy')
+
+
+def test_predict_with_results_db_scores_only_new_sequences(tmp_path, monkeypatch):
+    '''
+    A second predict() call with the same database should only score new
+    sequences and give stored and new scores the same type.
+    '''
+    import numpy as np
+
+    from TADA_T2 import TADA
+
+    scored = []
+
+    def fake_predict_tada(windows, **kwargs):
+        scored.extend(windows)
+        return [np.float32(0.25) for _ in windows]
+
+    monkeypatch.setattr(TADA, '_predict_tada', fake_predict_tada)
+    path = str(tmp_path / 'results.sqlite')
+    old = 'QFNENSNIMQQQPLQGSFNPLLEYDFANHGGQWLSDYIDL'
+    new = 'EFSPENSSSSSWSSQESFLWEESFLHQSFDQSFLLSSPTD'
+    first = TADA.predict([old], results_db=path)
+    assert scored == [old]
+    scored.clear()
+    second = TADA.predict([old, new], results_db=path)
+    assert scored == [new]
+    assert list(second) == [old, new]
+    assert second[old] == first[old]
+    assert all(type(score) is np.float32 for result in second.values() for _, score in result)
@@ -0,0 +1,67 @@
+'''
+Tests for the runtime configuration (thread counts and batch sizes).
+'''
+import pytest
+
+from TADA_T2.backend import runtime
+
+
+class FakeModel:
+    '''
+    Stands in for the Keras model and records the batch sizes it was called with.
+    '''
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, features, batch_size=32, verbose=0):
+        self.batch_sizes.append(batch_size)
+        return features[:, 0, :2]
+
+
+def test_default_thread_counts_split_cores(monkeypatch):
+    '''
+    The available cores should be split between the processes on the machine.
+    '''
+    monkeypatch.setattr(runtime, 'available_cores', lambda: 16)
+    monkeypatch.delenv('TADA_T2_PROCESSES', raising=False)
+    assert runtime.default_thread_counts() == (16, 2)
+    assert runtime.default_thread_counts(processes=8) == (2, 1)
+    monkeypatch.setenv('TADA_T2_PROCESSES', '32')
+    assert runtime.default_thread_counts() == (1, 1)
+    monkeypatch.setenv('TADA_T2_PROCESSES', 'many')
+    with pytest.raises(ValueError):
+        runtime.default_thread_counts()
+
+
+def test_resolve_batch_size(monkeypatch):
+    '''
+    Explicit sizes and the environment variable win, small jobs use a single
+    call and larger ones calibrate once per process.
+    '''
+    model = FakeModel()
+    monkeypatch.setattr(runtime, 'calibrated_batch_size', None)
+    monkeypatch.delenv('TADA_T2_BATCH_SIZE', raising=False)
+    assert runtime.resolve_batch_size(64, 10**6, model, (36, 42)) == 64
+    assert runtime.resolve_batch_size(None, 100, model, (36, 42)) == 100
+    monkeypatch.setenv('TADA_T2_BATCH_SIZE', '128')
+    assert runtime.resolve_batch_size(None, 100, model, (36, 42)) == 128
+    assert model.batch_sizes == []
+
+    monkeypatch.setenv('TADA_T2_BATCH_SIZE', 'auto')
+    size = runtime.resolve_batch_size(None, 10**6, model, (36, 42))
+    assert size in runtime.BATCH_SIZE_CANDIDATES
+    calls = len(model.batch_sizes)
+    assert runtime.resolve_batch_size('auto', 10**6, model, (36, 42)) == size
+    assert len(model.batch_sizes) == calls
+    with pytest.raises(ValueError):
+        runtime.resolve_batch_size(0, 10, model, (36, 42))
+
+
+def test_calibrate_batch_size_respects_memory():
+    '''
+    Candidates whose activations would not fit should not be tried.
+    '''
+    model = FakeModel()
+    max_memory = 64 * runtime.ACTIVATION_BYTES_PER_WINDOW
+    assert runtime.calibrate_batch_size(model, (36, 42), max_memory=max_memory) in (32, 64)
+    assert set(model.batch_sizes) == {32, 64}
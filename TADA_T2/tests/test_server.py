@@ -0,0 +1,82 @@
+'''
+Tests for the local prediction server and its client.
+'''
+import socket
+import threading
+
+import pytest
+
+from TADA_T2.TADA import predict
+from TADA_T2.backend.server import make_server
+from TADA_T2.backend.client import predict_remote
+
+SEQUENCES = ['QFNENSNIMQQQPLQGSFNPLLEYDFANHGGQWLSDYIDL',
+             'EFSPENSSSSSWSSQESFLWEESFLHQSFDQSFLLSSPTDEFSPENSSSSSWSSQE']
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='Unix sockets are not available.')
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    path = str(tmp_path / 'tada.sock')
+    server = make_server(socket_path=path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield path
+    server.shutdown()
+    server.server_close()
+
+
+def test_predict_remote_matches_predict(socket_path):
+    '''
+    Scores from the server should match local predictions.
+    '''
+    local = predict(SEQUENCES, verbose=False)
+    remote = predict_remote(SEQUENCES, socket_path=socket_path)
+    assert list(remote) == list(local)
+    for seq in SEQUENCES:
+        assert [window for window, _ in remote[seq]] == [window for window, _ in local[seq]]
+        assert all(abs(a[1] - b[1]) < 1e-6 for a, b in zip(remote[seq], local[seq]))
+
+
+def test_predict_remote_reports_errors(socket_path):
+    '''
+    Errors on the server should be raised on the client.
+    '''
+    with pytest.raises(ValueError):
+        predict_remote(['SHORT'], socket_path=socket_path)
+
+
+def test_predict_from_fasta_remote_rejects_duplicate_headers(socket_path, tmp_path):
+    '''
+    Duplicate headers should be an error, as for read_fasta(), instead of overwriting each other.
+    '''
+    from TADA_T2.backend.client import predict_from_fasta_remote
+
+    fasta = tmp_path / 'duplicates.fasta'
+    fasta.write_text(f'>a\n{SEQUENCES[0]}\n>a\n{SEQUENCES[1]}\n')
+    with pytest.raises(ValueError, match='duplicate headers'):
+        predict_from_fasta_remote(str(fasta), socket_path=socket_path)
+
+
+def test_server_keeps_one_feature_store(tmp_path):
+    '''
+    The server should open its feature store once and reuse it for every request.
+    '''
+    from TADA_T2.backend.feature_store import FeatureStore
+
+    path = str(tmp_path / 'tada.sock')
+    server = make_server(socket_path=path, feature_store=str(tmp_path / 'features'))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        store = server.batcher.feature_store
+        assert isinstance(store, FeatureStore)
+        first = predict_remote(SEQUENCES, socket_path=path)
+        second = predict_remote(SEQUENCES, socket_path=path)
+        assert server.batcher.feature_store is store
+        assert second == first
+        assert len(store.locate(SEQUENCES[:1])) == 1
+    finally:
+        server.shutdown()
+        server.server_close()
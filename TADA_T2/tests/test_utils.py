@@ -0,0 +1,54 @@
+'''
+Tests for the helper functions in TADA_T2.backend.utils.
+'''
+import numpy as np
+import pytest
+
+from TADA_T2.backend.utils import sliding_window, filter_window_scores
+
+
+def test_sliding_window():
+    '''
+    Windows should have the right length and step.
+    '''
+    windows = sliding_window('ABCDEFGH', 4, 2)
+    assert windows == ['ABCD', 'CDEF', 'EFGH']
+
+
+def test_filter_window_scores_threshold_and_top_k():
+    '''
+    Threshold and top_k filtering should be applied per record and keep window order.
+    '''
+    scores = np.array([0.1, 0.9, 0.6, 0.7, 0.2, 0.8, 0.3])
+    boundaries = [0, 4, 7]
+    kept = filter_window_scores(scores, boundaries, threshold=0.5)
+    assert [list(k) for k in kept] == [[1, 2, 3], [1]]
+    kept = filter_window_scores(scores, boundaries, top_k=2)
+    assert [list(k) for k in kept] == [[1, 3], [1, 2]]
+    kept = filter_window_scores(scores, boundaries, threshold=0.5, top_k=1)
+    assert [list(k) for k in kept] == [[1], [1]]
+
+
+def test_filtered_predict_checks_arguments_and_returns_float32(monkeypatch):
+    '''
+    Bad overlap_length or top_k should fail before anything is scored, and
+    filtered scores should have the same type as unfiltered ones.
+    '''
+    from TADA_T2 import TADA
+
+    scored = []
+
+    def fake_predict_tada(windows, **kwargs):
+        scored.extend(windows)
+        return [0.25 + 0.01 * i for i in range(len(windows))]
+
+    monkeypatch.setattr(TADA, '_predict_tada', fake_predict_tada)
+    sequence = 'QFNENSNIMQQQPLQGSFNPLLEYDFANHGGQWLSDYIDLEFSPENSSSS'
+    with pytest.raises(ValueError):
+        TADA.predict([sequence], overlap_length=40, top_k=1, verbose=False)
+    with pytest.raises(ValueError):
+        TADA.predict([sequence], top_k=0, verbose=False)
+    assert scored == []
+    result = TADA.predict([sequence], top_k=2, verbose=False)
+    assert len(result[sequence]) == 2
+    assert all(type(score) is np.float32 for _, score in result[sequence])
@@ -0,0 +1,66 @@
+'''
+Tests for the NumPy model and the pre-forked worker pool.
+'''
+import math
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from TADA_T2.backend import numpy_model
+from TADA_T2.backend.numpy_model import NumpyTadaModel
+from TADA_T2.backend.predictor import get_model, predict_tada, feature_shape
+from TADA_T2.backend.workers import WorkerPool
+
+WINDOWS = ['QFNENSNIMQQQPLQGSFNPLLEYDFANHGGQWLSDYIDL', 'EFSPENSSSSSWSSQESFLWEESFLHQSFDQSFLLSSPTD',
+           'MKRHDECWYTVILAFPGSNQMKRHDECWYTVILAFPGSNQ', 'DDDDDEEEEEWWWWWFFFFFLLLLLDDDDDEEEEEWWWWW']
+
+
+def test_erf_fallback_matches_math_erf(monkeypatch):
+    '''
+    The erf approximation used without scipy should be accurate to float32 precision.
+    '''
+    monkeypatch.setattr(numpy_model, 'erf', None)
+    x = np.linspace(-6, 6, 1001)
+    expected = np.array([math.erf(value) for value in x])
+    assert np.abs(numpy_model._erf(x) - expected).max() < 2e-7
+
+
+def test_numpy_model_matches_keras():
+    '''
+    The NumPy forward pass should give the same outputs as the Keras model.
+    '''
+    model = get_model()
+    features = np.random.default_rng(0).standard_normal((16,) + feature_shape()).astype(np.float32)
+    expected = model.predict(features, verbose=0)
+    scores = NumpyTadaModel.from_keras(model).predict(features, batch_size=5)
+    assert scores.shape == (16, 2)
+    assert np.allclose(scores, expected, atol=1e-5)
+    with pytest.raises(ValueError):
+        NumpyTadaModel(model.get_weights()[:-1])
+
+
+def test_numpy_model_from_hdf5_matches_keras_weights():
+    '''
+    Reading the weight file without Tensorflow should give the weights Keras loads.
+    '''
+    weights = NumpyTadaModel.from_hdf5().buffer
+    assert np.array_equal(weights, NumpyTadaModel.from_keras(get_model()).buffer)
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_worker_pool_matches_predict_tada():
+    '''
+    Scores from the worker pool should match predict_tada() and come back in order
+    when the windows are split over several batches.
+    '''
+    windows = WINDOWS * 5
+    with WorkerPool(workers=2, batch_windows=3) as pool:
+        scores = pool.predict(windows, return_both_values=True)
+        expected = predict_tada(windows, return_both_values=True)
+        assert np.allclose(scores, expected, atol=1e-5)
+        assert np.allclose(pool.predict(windows[:2]), expected[:2, 0], atol=1e-5)
+    with pytest.raises(ValueError):
+        pool.predict(windows)
+    with pytest.raises(ValueError):
+        predict_tada(windows, workers=pool, batch_size=8)
@@ -0,0 +1,55 @@
+'''
+Benchmarks create_features() against the fused feature kernels.
+
+Usage::
+
+    python devtools/scripts/benchmark_features.py --windows 2000
+'''
+import argparse
+import time
+
+import numpy as np
+
+from TADA_T2.backend.features import create_features
+from TADA_T2.backend.kernels import create_features_fused, available_backends
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def random_windows(num_windows, seed=0):
+    rng = np.random.default_rng(seed)
+    return [''.join(rng.choice(list(AMINO_ACIDS), 40)) for _ in range(num_windows)]
+
+
+def time_call(function, windows, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(windows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--windows', type=int, default=2000, help='Number of 40 amino acid windows. Default is 2000.')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Timed runs per implementation (best is kept). Default is 3.')
+    args = parser.parse_args()
+
+    windows = random_windows(args.windows)
+    implementations = {'create_features (localCIDER)': create_features}
+    for backend in available_backends():
+        # one untimed call compiles the Numba kernel and builds the residue table.
+        create_features_fused(windows[:10], backend=backend)
+        implementations[f'fused ({backend})'] = lambda w, backend=backend: create_features_fused(w, backend=backend)
+
+    reference = create_features(windows)
+    for name, function in implementations.items():
+        seconds = time_call(function, windows, args.repeats)
+        error = np.abs(function(windows) - reference).max()
+        print(f'{name:32s} {args.windows / seconds:12.0f} windows/s   max abs diff {error:.2e}')
+
+
+if __name__ == '__main__':
+    main()